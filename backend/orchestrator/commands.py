@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from collections import deque
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+class CommandResult(NamedTuple):
+    returncode: int
+    raw_stdout: bytes
+    raw_stderr: bytes
+    
+    # Decoded on access: the success path only looks at returncode
+    @property
+    def stdout(self) -> str:
+        return self.raw_stdout.decode('utf-8', errors='ignore')
+    
+    @property
+    def stderr(self) -> str:
+        return self.raw_stderr.decode('utf-8', errors='ignore')
+
+# Bytes read from a subprocess pipe at a time
+_READ_CHUNK_SIZE = 64 * 1024
+
+async def drain_stream(stream: asyncio.StreamReader, tail: deque, label: Optional[str] = None):
+    """Read a subprocess stream, keeping only the last lines (logged at debug level under label)"""
+    # Lines are split here rather than with readline(), which gives up on any
+    # line longer than the stream limit and loses its data
+    pending = bytearray()
+    while True:
+        data = await stream.read(_READ_CHUNK_SIZE)
+        if not data:
+            break
+        pending += data
+        start = 0
+        while (end := pending.find(b"\n", start)) != -1:
+            line = bytes(pending[start:end + 1])
+            tail.append(line)
+            if label:
+                logger.debug(f"[{label}] {line.decode('utf-8', errors='ignore').rstrip()}")
+            start = end + 1
+        del pending[:start]
+    
+    if pending:
+        # Unterminated last line
+        tail.append(bytes(pending))
+        if label:
+            logger.debug(f"[{label}] {pending.decode('utf-8', errors='ignore').rstrip()}")
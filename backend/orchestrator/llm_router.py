@@ -251,7 +251,7 @@ class LLMRouter:
             conversation_history = self.conversation_histories.get(run_id, [])
             
             # Prepare messages with caching optimization
-            messages, cache_used = await self.prompt_cache.prepare_openai_messages(
+            messages, cache_used = self.prompt_cache.prepare_openai_messages(
                 task_type, prompt, conversation_history
             )
             
@@ -319,7 +319,7 @@ class LLMRouter:
             conversation_history = self.conversation_histories.get(run_id, [])
             
             # Prepare messages with caching optimization
-            system_prompt, messages, cache_used = await self.prompt_cache.prepare_anthropic_messages(
+            system_prompt, messages, cache_used = self.prompt_cache.prepare_anthropic_messages(
                 task_type, prompt, conversation_history
             )
             
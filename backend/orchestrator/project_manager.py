@@ -1,144 +1,23 @@
 import os
+import sys
 import logging
 import asyncio
 import shutil
-import json
+import fcntl
+import copy
+import orjson
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 from datetime import datetime, timezone
-import subprocess
-import tempfile
+from .commands import CommandResult, drain_stream
 
 logger = logging.getLogger(__name__)
 
-class ProjectManager:
-    def __init__(self):
-        self.projects_base_path = Path(os.getenv("PROJECTS_BASE_PATH", "/app/projects"))
-        self.auto_create_structures = os.getenv("AUTO_CREATE_STRUCTURES", "true").lower() == "true"
-        self.projects_base_path.mkdir(parents=True, exist_ok=True)
-    
-    async def create_project_workspace(self, project_id: str, stack: str, project_name: str = None) -> Dict[str, Any]:
-        """Create isolated workspace for a project"""
-        try:
-            project_path = self.projects_base_path / project_id
-            project_path.mkdir(parents=True, exist_ok=True)
-            
-            # Create directory structure
-            directories = {
-                "code": project_path / "code",
-                "logs": project_path / "logs", 
-                "tests": project_path / "tests",
-                "patches": project_path / "patches",
-                "backups": project_path / "backups",
-                "git": project_path / "git"
-            }
-            
-            for name, path in directories.items():
-                path.mkdir(parents=True, exist_ok=True)
-            
-            # Create project metadata
-            metadata = {
-                "id": project_id,
-                "name": project_name or f"Project {project_id[:8]}",
-                "stack": stack,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "directories": {name: str(path) for name, path in directories.items()},
-                "status": "initialized"
-            }
-            
-            # Save metadata
-            metadata_file = project_path / "project.json"
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f, indent=2)
-            
-            # Auto-create project structure if enabled
-            if self.auto_create_structures:
-                await self._create_project_structure(directories["code"], stack, project_name)
-
-                # ✅ Install dependencies automatically after scaffolding
-                logger.info(f"Auto-installing dependencies for {stack} project {project_id}")
-                install_success = await self.install_dependencies(str(project_path), stack)
-                if install_success:
-                    metadata["dependencies_installed"] = True
-                    logger.info(f"Dependencies successfully installed for {stack} project")
-                else:
-                    metadata["dependencies_installed"] = False
-                    logger.warning(f"Dependencies installation failed for {stack} project")
-            
-            logger.info(f"Created workspace for project {project_id} with stack {stack}")
-            return {
-                "project_id": project_id,
-                "project_path": str(project_path),
-                "code_path": str(directories["code"]),
-                "logs_path": str(directories["logs"]),
-                "metadata": metadata
-            }
-            
-        except Exception as e:
-            logger.error(f"Error creating project workspace: {e}")
-            raise
-    
-    async def _create_project_structure(self, code_path: Path, stack: str, project_name: str = None):
-        """Auto-create project structure based on stack"""
-        try:
-            if stack == "laravel":
-                await self._create_laravel_structure(code_path, project_name)
-            elif stack == "react":
-                await self._create_react_structure(code_path, project_name)
-            elif stack == "vue":
-                await self._create_vue_structure(code_path, project_name)
-            elif stack == "python":
-                await self._create_python_structure(code_path, project_name)
-            elif stack == "node":
-                await self._create_node_structure(code_path, project_name)
-                
-        except Exception as e:
-            logger.error(f"Error creating {stack} structure: {e}")
-            # Don't fail the workspace creation if structure creation fails
-    
-    async def _create_laravel_structure(self, code_path: Path, project_name: str = None):
-        """Create minimal Laravel structure"""
-        try:
-            # Create basic Laravel directory structure
-            directories = [
-                "app/Http/Controllers",
-                "app/Models", 
-                "app/Http/Requests",
-                "app/Http/Middleware",
-                "routes",
-                "database/migrations",
-                "database/seeders",
-                "tests/Feature",
-                "tests/Unit",
-                "config",
-                "resources/views",
-                "public"
-            ]
-            
-            for dir_path in directories:
-                (code_path / dir_path).mkdir(parents=True, exist_ok=True)
-            
-            # Create basic files
-            files = {
-                "routes/web.php": """<?php
-
-use Illuminate\Support\Facades\Route;
-
-Route::get('/', function () {
-    return view('welcome');
-});
-""",
-                "routes/api.php": """<?php
-
-use Illuminate\Http\Request;
-use Illuminate\Support\Facades\Route;
-
-Route::middleware('auth:sanctum')->get('/user', function (Request $request) {
-    return $request->user();
-});
-""",
-                "composer.json": f"""{{
-    "name": "laravel/{project_name or 'project'}",
+# Scaffold file templates, formatted with the project name at creation time
+_LARAVEL_COMPOSER_JSON = """{{
+    "name": "laravel/{name}",
     "type": "project",
     "description": "The Laravel Framework.",
     "keywords": ["framework", "laravel"],
@@ -164,8 +43,173 @@ Route::middleware('auth:sanctum')->get('/user', function (Request $request) {
         "analyse": "phpstan analyse",
         "format": "pint"
     }}
-}}""",
-                ".env": """APP_NAME=Laravel
+}}"""
+
+_REACT_PACKAGE_JSON = """{{
+  "name": "{name}",
+  "version": "0.1.0",
+  "private": true,
+  "dependencies": {{
+    "react": "^18.0.0",
+    "react-dom": "^18.0.0",
+    "react-scripts": "5.0.1"
+  }},
+  "scripts": {{
+    "start": "react-scripts start",
+    "build": "react-scripts build", 
+    "test": "react-scripts test",
+    "eject": "react-scripts eject",
+    "lint": "eslint src/"
+  }},
+  "devDependencies": {{
+    "@testing-library/jest-dom": "^5.0.0",
+    "@testing-library/react": "^13.0.0",
+    "@testing-library/user-event": "^13.0.0",
+    "eslint": "^8.0.0"
+  }}
+}}"""
+
+_REACT_INDEX_HTML = """<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1" />
+    <title>{name}</title>
+  </head>
+  <body>
+    <noscript>You need to enable JavaScript to run this app.</noscript>
+    <div id="root"></div>
+  </body>
+</html>"""
+
+_PYTHON_SETUP_PY = """from setuptools import setup, find_packages
+
+setup(
+    name='{name}',
+    version='0.1.0',
+    packages=find_packages(),
+    install_requires=[
+        'fastapi',
+        'uvicorn',
+        'pydantic'
+    ],
+    python_requires='>=3.8',
+)"""
+
+_NODE_PACKAGE_JSON = """{{
+  "name": "{name}",
+  "version": "1.0.0",
+  "description": "",
+  "main": "src/index.js",
+  "scripts": {{
+    "start": "node src/index.js",
+    "dev": "nodemon src/index.js",
+    "test": "jest",
+    "lint": "eslint src/"
+  }},
+  "dependencies": {{
+    "express": "^4.18.0"
+  }},
+  "devDependencies": {{
+    "jest": "^29.0.0",
+    "nodemon": "^3.0.0",
+    "eslint": "^8.0.0"
+  }}
+}}"""
+
+_NODE_INDEX_JS = """const express = require('express');
+const app = express();
+const port = process.env.PORT || 3000;
+
+app.use(express.json());
+
+app.get('/', (req, res) => {{
+  res.json({{ message: 'Hello World from {name}!' }});
+}});
+
+app.listen(port, () => {{
+  console.log(`Server running on port ${{port}}`);
+}});
+
+module.exports = app;
+"""
+
+# Vue templates are kept as bytes; only the {name} slot is substituted per project
+_VUE_PACKAGE_JSON = b"""{
+  "name": "{name}",
+  "version": "0.1.0",
+  "private": true,
+  "scripts": {
+    "serve": "vue-cli-service serve",
+    "build": "vue-cli-service build",
+    "test": "vue-cli-service test:unit",
+    "lint": "vue-cli-service lint"
+  },
+  "dependencies": {
+    "vue": "^3.0.0",
+    "vue-router": "^4.0.0"
+  },
+  "devDependencies": {
+    "@vue/cli-service": "^5.0.0",
+    "@vue/test-utils": "^2.0.0",
+    "jest": "^29.0.0"
+  }
+}"""
+
+_VUE_INDEX_HTML = b"""<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width,initial-scale=1.0">
+    <title>{name}</title>
+  </head>
+  <body>
+    <noscript>
+      <strong>We're sorry but this app doesn't work properly without JavaScript enabled.</strong>
+    </noscript>
+    <div id="app"></div>
+  </body>
+</html>"""
+
+def _encode_files(files: Dict[str, str]) -> Dict[str, bytes]:
+    """Pre-encode static scaffold files once at import time"""
+    return {path: content.encode('utf-8') for path, content in files.items()}
+
+# Per-stack scaffold directories, and static files written verbatim
+_LARAVEL_DIRS = (
+    "app/Http/Controllers",
+    "app/Models",
+    "app/Http/Requests",
+    "app/Http/Middleware",
+    "routes",
+    "database/migrations",
+    "database/seeders",
+    "tests/Feature",
+    "tests/Unit",
+    "config",
+    "resources/views",
+    "public",
+)
+
+_LARAVEL_STATIC_FILES = _encode_files({
+    "routes/web.php": """<?php
+
+use Illuminate\Support\Facades\Route;
+
+Route::get('/', function () {
+    return view('welcome');
+});
+""",
+    "routes/api.php": """<?php
+
+use Illuminate\Http\Request;
+use Illuminate\Support\Facades\Route;
+
+Route::middleware('auth:sanctum')->get('/user', function (Request $request) {
+    return $request->user();
+});
+""",
+    ".env": """APP_NAME=Laravel
 APP_ENV=local
 APP_KEY=
 APP_DEBUG=true
@@ -174,7 +218,7 @@ APP_URL=http://localhost
 DB_CONNECTION=sqlite
 DB_DATABASE=database/database.sqlite
 """,
-                "phpunit.xml": """<?xml version="1.0" encoding="UTF-8"?>
+    "phpunit.xml": """<?xml version="1.0" encoding="UTF-8"?>
 <phpunit xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
          xsi:noNamespaceSchemaLocation="./vendor/phpunit/phpunit/phpunit.xsd"
          bootstrap="vendor/autoload.php"
@@ -188,13 +232,429 @@ DB_DATABASE=database/database.sqlite
         </testsuite>
     </testsuites>
 </phpunit>"""
+})
+
+_REACT_DIRS = (
+    "src/components",
+    "src/hooks",
+    "src/utils",
+    "src/pages",
+    "src/styles",
+    "public",
+    "tests",
+)
+
+_REACT_STATIC_FILES = _encode_files({
+    "src/App.js": """import React from 'react';
+import './App.css';
+
+function App() {
+  return (
+    <div className="App">
+      <header className="App-header">
+        <h1>Welcome to React</h1>
+        <p>
+          Edit <code>src/App.js</code> and save to reload.
+        </p>
+      </header>
+    </div>
+  );
+}
+
+export default App;
+""",
+    "src/index.js": """import React from 'react';
+import ReactDOM from 'react-dom/client';
+import './index.css';
+import App from './App';
+
+const root = ReactDOM.createRoot(document.getElementById('root'));
+root.render(
+  <React.StrictMode>
+    <App />
+  </React.StrictMode>
+);
+"""
+})
+
+_PYTHON_DIRS = (
+    "tests",
+    "docs",
+)
+
+_PYTHON_STATIC_FILES = _encode_files({
+    "requirements.txt": """# Core dependencies
+fastapi==0.104.1
+uvicorn==0.24.0
+pydantic==2.5.0
+
+# Development dependencies  
+pytest==7.4.3
+black==23.12.1
+mypy==1.8.0
+flake8==6.1.0
+""",
+    "tests/__init__.py": "",
+    "tests/test_main.py": """import pytest
+from fastapi.testclient import TestClient
+from src.main import app
+
+client = TestClient(app)
+
+def test_read_main():
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.json() == {'message': 'Hello World'}
+"""
+})
+
+_PYTHON_MAIN_PY = """from fastapi import FastAPI
+
+app = FastAPI(title=f'{project_name or 'Python Project'}')
+
+@app.get('/')
+async def root():
+    return {'message': 'Hello World'}
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8000)
+""".encode('utf-8')
+
+_NODE_DIRS = (
+    "src",
+    "tests",
+    "docs",
+)
+
+_NODE_STATIC_FILES = _encode_files({
+    "tests/index.test.js": """const request = require('supertest');
+const app = require('../src/index');
+
+describe('GET /', () => {
+  it('should return Hello World message', async () => {
+    const response = await request(app).get('/');
+    expect(response.status).toBe(200);
+    expect(response.body.message).toContain('Hello World');
+  });
+});
+"""
+})
+
+_VUE_DIRS = (
+    "src/components",
+    "src/views",
+    "src/router",
+    "src/store",
+    "public",
+    "tests",
+)
+
+_VUE_STATIC_FILES = _encode_files({
+    "src/App.vue": """<template>
+  <div id="app">
+    <header>
+      <h1>Welcome to Vue.js</h1>
+    </header>
+    <main>
+      <p>This is a Vue.js application.</p>
+    </main>
+  </div>
+</template>
+
+<script>
+export default {
+  name: 'App'
+}
+</script>
+
+<style>
+#app {
+  font-family: 'Avenir', Helvetica, Arial, sans-serif;
+  text-align: center;
+  color: #2c3e50;
+  margin-top: 60px;
+}
+</style>
+""",
+    "src/main.js": """import { createApp } from 'vue'
+import App from './App.vue'
+
+createApp(App).mount('#app')
+"""
+})
+
+def _write_metadata(metadata_file: Path, metadata: Dict[str, Any]):
+    """Persist project metadata as project.json"""
+    with open(metadata_file, 'wb') as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+
+def _read_metadata(metadata_file: Path) -> Optional[Dict[str, Any]]:
+    """Read and parse project.json, or None if the project has none"""
+    try:
+        with open(metadata_file, 'rb') as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def _list_project_dirs(base_path: Path) -> List[str]:
+    """Names of the project directories under base_path"""
+    with os.scandir(base_path) as it:
+        return [entry.name for entry in it if entry.is_dir(follow_symlinks=False)]
+
+def _acquire_file_lock(lock_path: Path) -> int:
+    """Take an exclusive flock on lock_path (blocking, run in a worker thread)"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+def _release_file_lock(fd: int):
+    """Release a lock taken by _acquire_file_lock"""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+def _release_abandoned_file_lock(acquire: asyncio.Future):
+    """Release a lock whose acquisition finished after its waiter was cancelled"""
+    if not acquire.cancelled() and acquire.exception() is None:
+        _release_file_lock(acquire.result())
+
+# Lines of stdout/stderr kept per command; install logs can run to megabytes
+_OUTPUT_TAIL_LINES = 500
+
+def _make_dirs(paths: List[str]):
+    """Create directories (blocking, run in a worker thread)"""
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+def _materialize_scaffold(code_path: Path, directories: List[str], files: Dict[str, bytes]):
+    """Create scaffold directories, then write files into them (blocking, run in a worker thread)"""
+    _make_dirs(directories)
+    for file_path, data in files.items():
+        _write_bytes_file(code_path / file_path, data)
+
+def _make_workspace_dirs(base: str, names: Tuple[str, ...]):
+    """Create base and whichever of its subdirectories are missing (blocking, run in a worker thread)"""
+    try:
+        with os.scandir(base) as it:
+            existing = {entry.name for entry in it}
+    except FileNotFoundError:
+        os.makedirs(base, exist_ok=True)
+        existing = set()
+    
+    for name in names:
+        if name not in existing:
+            try:
+                os.mkdir(f"{base}/{name}")
+            except FileExistsError:
+                pass
+
+def _write_bytes_file(path: Path, data: bytes):
+    """Write a single scaffold file (blocking, run in a worker thread)"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+class ProjectManager:
+    # Per-project workspace subdirectories
+    _DIR_NAMES = ("code", "logs", "tests", "patches", "backups", "git")
+    
+    def __init__(self):
+        self.projects_base_path = Path(os.getenv("PROJECTS_BASE_PATH", "/app/projects"))
+        self.auto_create_structures = os.getenv("AUTO_CREATE_STRUCTURES", "true").lower() == "true"
+        self.projects_base_path.mkdir(parents=True, exist_ok=True)
+        self._install_tasks: Dict[str, asyncio.Task] = {}
+        
+        # project_id -> ((mtime_ns, size) of project.json, parsed metadata)
+        self._metadata_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        
+        # (projects_base_path mtime_ns, project directory names), rescanned only when
+        # the base directory changes behind our back; each project.json is still
+        # revalidated on every listing, since other workers rewrite them in place
+        self._projects_cache: Optional[Tuple[int, List[str]]] = None
+        
+        # Package manager caches shared by every workspace, so identical
+        # dependency sets are downloaded once rather than per project
+        self.package_cache_path = Path(os.getenv("PACKAGE_CACHE_PATH", "/app/cache"))
+        self.cache_env = {
+            "COMPOSER_CACHE_DIR": str(self.package_cache_path / "composer"),
+            "YARN_CACHE_FOLDER": str(self.package_cache_path / "yarn"),
+            "PIP_CACHE_DIR": str(self.package_cache_path / "pip"),
+            "UV_CACHE_DIR": str(self.package_cache_path / "uv"),
+        }
+        self.wheelhouse_path = self.package_cache_path / "wheels"
+        self._exe_cache: Dict[str, str] = {}
+        
+        # Prefer the faster installers when present, falling back to pip/yarn
+        if shutil.which("uv"):
+            # Same interpreter (and so the same virtualenv) the pip fallback installs into
+            self._py_installer = ["uv", "pip", "install", "--python", sys.executable]
+        else:
+            self._py_installer = ["pip", "install"]
+        if shutil.which("pnpm"):
+            self._js_installer = ["pnpm", "install", "--prefer-offline",
+                                  "--store-dir", str(self.package_cache_path / "pnpm")]
+        else:
+            self._js_installer = ["yarn", "install", "--prefer-offline"]
+        
+        # One install per package manager at a time (they share a cache),
+        # and a global cap on concurrent installs
+        self._install_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._install_semaphore = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_INSTALLS", "2")))
+    
+    async def create_project_workspace(self, project_id: str, stack: str, project_name: str = None) -> Dict[str, Any]:
+        """Create isolated workspace for a project"""
+        try:
+            project_path = self.projects_base_path / project_id
+            
+            # Create directory structure
+            base = str(project_path)
+            directories = {name: f"{base}/{name}" for name in self._DIR_NAMES}
+            await asyncio.to_thread(_make_workspace_dirs, base, self._DIR_NAMES)
+            
+            # Create project metadata
+            metadata = {
+                "id": project_id,
+                "name": project_name or f"Project {project_id[:8]}",
+                "stack": stack,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "directories": directories,
+                "status": "installing" if self.auto_create_structures else "initialized"
+            }
+            
+            # Save metadata, overlapped with the scaffold when structures are enabled
+            metadata_file = project_path / "project.json"
+            write_metadata = asyncio.to_thread(_write_metadata, metadata_file, metadata)
+            
+            # Auto-create project structure if enabled
+            if self.auto_create_structures:
+                await asyncio.gather(
+                    write_metadata,
+                    self._create_project_structure(Path(directories["code"]), stack, project_name)
+                )
+                await self._update_cached_projects(project_id, metadata)
+
+                # ✅ Install dependencies in the background so the workspace is usable immediately
+                logger.info(f"Auto-installing dependencies for {stack} project {project_id}")
+                install_task = asyncio.create_task(
+                    self._install_in_background(project_id, str(project_path), stack, metadata)
+                )
+                self._install_tasks[project_id] = install_task
+                install_task.add_done_callback(lambda task: self._forget_install(project_id, task))
+            else:
+                await write_metadata
+                await self._update_cached_projects(project_id, metadata)
+            
+            logger.info(f"Created workspace for project {project_id} with stack {stack}")
+            return {
+                "project_id": project_id,
+                "project_path": str(project_path),
+                "code_path": directories["code"],
+                "logs_path": directories["logs"],
+                "metadata": metadata
             }
             
-            for file_path, content in files.items():
-                full_path = code_path / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(full_path, 'w') as f:
-                    f.write(content)
+        except Exception as e:
+            logger.error(f"Error creating project workspace: {e}")
+            raise
+    
+    async def create_many(self, specs: List[Tuple[str, str, Optional[str]]]) -> List[Dict[str, Any]]:
+        """Create several (project_id, stack, project_name) workspaces concurrently"""
+        # Scaffolding is bounded per CPU; installs are already capped by _install_semaphore
+        limit = asyncio.Semaphore(os.cpu_count() or 1)
+        
+        async def create_one(project_id: str, stack: str, project_name: Optional[str]):
+            async with limit:
+                return await self.create_project_workspace(project_id, stack, project_name)
+        
+        return await asyncio.gather(*(create_one(*spec) for spec in specs))
+    
+    async def _install_in_background(self, project_id: str, project_path: str, stack: str,
+                                     metadata: Dict[str, Any]) -> bool:
+        """Install dependencies and record the outcome in project.json"""
+        install_success = await self.install_dependencies(project_path, stack)
+        if install_success:
+            logger.info(f"Dependencies successfully installed for {stack} project")
+        else:
+            logger.warning(f"Dependencies installation failed for {stack} project")
+        
+        try:
+            updated = {**metadata, "status": "initialized", "dependencies_installed": install_success}
+            await asyncio.to_thread(_write_metadata, Path(project_path) / "project.json", updated)
+            await self._update_cached_projects(project_id, updated)
+        except Exception as e:
+            logger.error(f"Error updating metadata for project {project_id}: {e}")
+        
+        return install_success
+    
+    async def wait_for_install(self, project_id: str) -> Optional[bool]:
+        """Wait for a project's background dependency install.
+        
+        Returns the install outcome, or None if no install is in progress
+        (a finished install's outcome is in the project metadata).
+        """
+        task = self._install_tasks.get(project_id)
+        if task is None:
+            return None
+        try:
+            # Shielded so that a cancelled waiter leaves the install running for everyone else
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                # The install itself was cancelled (e.g. the project was deleted)
+                return False
+            raise
+    
+    def _forget_install(self, project_id: str, task: asyncio.Task):
+        """Drop a finished install task, unless a newer one has replaced it"""
+        if self._install_tasks.get(project_id) is task:
+            del self._install_tasks[project_id]
+    
+    async def _create_project_structure(self, code_path: Path, stack: str, project_name: str = None):
+        """Auto-create project structure based on stack"""
+        try:
+            scaffolder = self._SCAFFOLDERS.get(stack)
+            if scaffolder:
+                await scaffolder(self, code_path, project_name)
+                
+        except Exception as e:
+            logger.error(f"Error creating {stack} structure: {e}")
+            # Don't fail the workspace creation if structure creation fails
+    
+    async def _write_scaffold(self, code_path: Path, directories: Tuple[str, ...], files: Dict[str, bytes]):
+        """Create scaffold directories and files in one worker-thread call"""
+        # Each stack's directory list covers every scaffold file's parent
+        wanted = {str(code_path / dir_path) for dir_path in directories}
+        
+        # makedirs creates intermediate parents, so only the deepest paths are needed
+        leaves = []
+        for path in sorted(wanted, key=len, reverse=True):
+            if not any(leaf.startswith(path + os.sep) for leaf in leaves):
+                leaves.append(path)
+        
+        await asyncio.to_thread(_materialize_scaffold, code_path, leaves, files)
+    
+    async def _create_laravel_structure(self, code_path: Path, project_name: str = None):
+        """Create minimal Laravel structure"""
+        try:
+            # Create basic Laravel directory structure
+            directories = _LARAVEL_DIRS
+            
+            # Create basic files
+            files = dict(_LARAVEL_STATIC_FILES)
+            files["composer.json"] = _LARAVEL_COMPOSER_JSON.format(name=project_name or 'project').encode('utf-8')
+            
+            await self._write_scaffold(code_path, directories, files)
             
             logger.info(f"Created Laravel structure at {code_path}")
             
@@ -206,93 +666,14 @@ DB_DATABASE=database/database.sqlite
         """Create minimal React structure"""
         try:
             # Create React directory structure
-            directories = [
-                "src/components",
-                "src/hooks",
-                "src/utils",
-                "src/pages",
-                "src/styles",
-                "public",
-                "tests"
-            ]
-            
-            for dir_path in directories:
-                (code_path / dir_path).mkdir(parents=True, exist_ok=True)
+            directories = _REACT_DIRS
             
             # Create basic files
-            files = {
-                "package.json": f"""{{
-  "name": "{project_name or 'react-project'}",
-  "version": "0.1.0",
-  "private": true,
-  "dependencies": {{
-    "react": "^18.0.0",
-    "react-dom": "^18.0.0",
-    "react-scripts": "5.0.1"
-  }},
-  "scripts": {{
-    "start": "react-scripts start",
-    "build": "react-scripts build", 
-    "test": "react-scripts test",
-    "eject": "react-scripts eject",
-    "lint": "eslint src/"
-  }},
-  "devDependencies": {{
-    "@testing-library/jest-dom": "^5.0.0",
-    "@testing-library/react": "^13.0.0",
-    "@testing-library/user-event": "^13.0.0",
-    "eslint": "^8.0.0"
-  }}
-}}""",
-                "src/App.js": """import React from 'react';
-import './App.css';
-
-function App() {
-  return (
-    <div className="App">
-      <header className="App-header">
-        <h1>Welcome to React</h1>
-        <p>
-          Edit <code>src/App.js</code> and save to reload.
-        </p>
-      </header>
-    </div>
-  );
-}
-
-export default App;
-""",
-                "src/index.js": """import React from 'react';
-import ReactDOM from 'react-dom/client';
-import './index.css';
-import App from './App';
-
-const root = ReactDOM.createRoot(document.getElementById('root'));
-root.render(
-  <React.StrictMode>
-    <App />
-  </React.StrictMode>
-);
-""",
-                "public/index.html": f"""<!DOCTYPE html>
-<html lang="en">
-  <head>
-    <meta charset="utf-8" />
-    <meta name="viewport" content="width=device-width, initial-scale=1" />
-    <title>{project_name or 'React App'}</title>
-  </head>
-  <body>
-    <noscript>You need to enable JavaScript to run this app.</noscript>
-    <div id="root"></div>
-  </body>
-</html>"""
-            }
+            files = dict(_REACT_STATIC_FILES)
+            files["package.json"] = _REACT_PACKAGE_JSON.format(name=project_name or 'react-project').encode('utf-8')
+            files["public/index.html"] = _REACT_INDEX_HTML.format(name=project_name or 'React App').encode('utf-8')
             
-            for file_path, content in files.items():
-                full_path = code_path / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(full_path, 'w') as f:
-                    f.write(content)
+            await self._write_scaffold(code_path, directories, files)
             
             logger.info(f"Created React structure at {code_path}")
             
@@ -304,73 +685,15 @@ root.render(
         """Create minimal Python structure"""
         try:
             # Create Python directory structure
-            directories = [
-                f"{project_name or 'src'}",
-                "tests",
-                "docs"
-            ]
-            
-            for dir_path in directories:
-                (code_path / dir_path).mkdir(parents=True, exist_ok=True)
+            directories = (project_name or 'src', *_PYTHON_DIRS)
             
             # Create basic files
-            files = {
-                "requirements.txt": """# Core dependencies
-fastapi==0.104.1
-uvicorn==0.24.0
-pydantic==2.5.0
-
-# Development dependencies  
-pytest==7.4.3
-black==23.12.1
-mypy==1.8.0
-flake8==6.1.0
-""",
-                "setup.py": f"""from setuptools import setup, find_packages
-
-setup(
-    name='{project_name or 'python-project'}',
-    version='0.1.0',
-    packages=find_packages(),
-    install_requires=[
-        'fastapi',
-        'uvicorn',
-        'pydantic'
-    ],
-    python_requires='>=3.8',
-)""",
-                f"{project_name or 'src'}/__init__.py": "",
-                f"{project_name or 'src'}/main.py": """from fastapi import FastAPI
-
-app = FastAPI(title=f'{project_name or 'Python Project'}')
-
-@app.get('/')
-async def root():
-    return {'message': 'Hello World'}
-
-if __name__ == '__main__':
-    import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=8000)
-""",
-                "tests/__init__.py": "",
-                "tests/test_main.py": """import pytest
-from fastapi.testclient import TestClient
-from src.main import app
-
-client = TestClient(app)
-
-def test_read_main():
-    response = client.get('/')
-    assert response.status_code == 200
-    assert response.json() == {'message': 'Hello World'}
-"""
-            }
+            files = dict(_PYTHON_STATIC_FILES)
+            files["setup.py"] = _PYTHON_SETUP_PY.format(name=project_name or 'python-project').encode('utf-8')
+            files[f"{project_name or 'src'}/__init__.py"] = b""
+            files[f"{project_name or 'src'}/main.py"] = _PYTHON_MAIN_PY
             
-            for file_path, content in files.items():
-                full_path = code_path / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(full_path, 'w') as f:
-                    f.write(content)
+            await self._write_scaffold(code_path, directories, files)
             
             logger.info(f"Created Python structure at {code_path}")
             
@@ -382,71 +705,14 @@ def test_read_main():
         """Create minimal Node.js structure"""
         try:
             # Create Node directory structure
-            directories = [
-                "src",
-                "tests",
-                "docs"
-            ]
-            
-            for dir_path in directories:
-                (code_path / dir_path).mkdir(parents=True, exist_ok=True)
+            directories = _NODE_DIRS
             
             # Create basic files
-            files = {
-                "package.json": f"""{{
-  "name": "{project_name or 'node-project'}",
-  "version": "1.0.0",
-  "description": "",
-  "main": "src/index.js",
-  "scripts": {{
-    "start": "node src/index.js",
-    "dev": "nodemon src/index.js",
-    "test": "jest",
-    "lint": "eslint src/"
-  }},
-  "dependencies": {{
-    "express": "^4.18.0"
-  }},
-  "devDependencies": {{
-    "jest": "^29.0.0",
-    "nodemon": "^3.0.0",
-    "eslint": "^8.0.0"
-  }}
-}}""",
-                "src/index.js": f"""const express = require('express');
-const app = express();
-const port = process.env.PORT || 3000;
-
-app.use(express.json());
-
-app.get('/', (req, res) => {{
-  res.json({{ message: 'Hello World from {project_name or 'Node.js'}!' }});
-}});
-
-app.listen(port, () => {{
-  console.log(`Server running on port ${{port}}`);
-}});
-
-module.exports = app;
-""",
-                "tests/index.test.js": """const request = require('supertest');
-const app = require('../src/index');
-
-describe('GET /', () => {
-  it('should return Hello World message', async () => {
-    const response = await request(app).get('/');
-    expect(response.status).toBe(200);
-    expect(response.body.message).toContain('Hello World');
-  });
-});
-"""
-            }
+            files = dict(_NODE_STATIC_FILES)
+            files["package.json"] = _NODE_PACKAGE_JSON.format(name=project_name or 'node-project').encode('utf-8')
+            files["src/index.js"] = _NODE_INDEX_JS.format(name=project_name or 'Node.js').encode('utf-8')
             
-            for file_path, content in files.items():
-                full_path = code_path / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(full_path, 'w') as f:
-                    f.write(content)
+            await self._write_scaffold(code_path, directories, files)
             
             logger.info(f"Created Node.js structure at {code_path}")
             
@@ -458,92 +724,14 @@ describe('GET /', () => {
         """Create minimal Vue.js structure"""
         try:
             # Create Vue directory structure
-            directories = [
-                "src/components",
-                "src/views", 
-                "src/router",
-                "src/store",
-                "public",
-                "tests"
-            ]
-            
-            for dir_path in directories:
-                (code_path / dir_path).mkdir(parents=True, exist_ok=True)
+            directories = _VUE_DIRS
             
             # Create basic files
-            files = {
-                "package.json": f"""{{
-  "name": "{project_name or 'vue-project'}",
-  "version": "0.1.0",
-  "private": true,
-  "scripts": {{
-    "serve": "vue-cli-service serve",
-    "build": "vue-cli-service build",
-    "test": "vue-cli-service test:unit",
-    "lint": "vue-cli-service lint"
-  }},
-  "dependencies": {{
-    "vue": "^3.0.0",
-    "vue-router": "^4.0.0"
-  }},
-  "devDependencies": {{
-    "@vue/cli-service": "^5.0.0",
-    "@vue/test-utils": "^2.0.0",
-    "jest": "^29.0.0"
-  }}
-}}""",
-                "src/App.vue": """<template>
-  <div id="app">
-    <header>
-      <h1>Welcome to Vue.js</h1>
-    </header>
-    <main>
-      <p>This is a Vue.js application.</p>
-    </main>
-  </div>
-</template>
-
-<script>
-export default {
-  name: 'App'
-}
-</script>
-
-<style>
-#app {
-  font-family: 'Avenir', Helvetica, Arial, sans-serif;
-  text-align: center;
-  color: #2c3e50;
-  margin-top: 60px;
-}
-</style>
-""",
-                "src/main.js": """import { createApp } from 'vue'
-import App from './App.vue'
-
-createApp(App).mount('#app')
-""",
-                "public/index.html": f"""<!DOCTYPE html>
-<html lang="en">
-  <head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width,initial-scale=1.0">
-    <title>{project_name or 'Vue App'}</title>
-  </head>
-  <body>
-    <noscript>
-      <strong>We're sorry but this app doesn't work properly without JavaScript enabled.</strong>
-    </noscript>
-    <div id="app"></div>
-  </body>
-</html>"""
-            }
+            files = dict(_VUE_STATIC_FILES)
+            files["package.json"] = _VUE_PACKAGE_JSON.replace(b"{name}", (project_name or 'vue-project').encode('utf-8'))
+            files["public/index.html"] = _VUE_INDEX_HTML.replace(b"{name}", (project_name or 'Vue App').encode('utf-8'))
             
-            for file_path, content in files.items():
-                full_path = code_path / file_path
-                full_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(full_path, 'w') as f:
-                    f.write(content)
+            await self._write_scaffold(code_path, directories, files)
             
             logger.info(f"Created Vue.js structure at {code_path}")
             
@@ -551,46 +739,109 @@ createApp(App).mount('#app')
             logger.error(f"Error creating Vue.js structure: {e}")
             raise
     
+    # Stack name -> scaffold coroutine; register new stacks here
+    _SCAFFOLDERS: Dict[str, Callable[..., Awaitable[None]]] = {
+        "laravel": _create_laravel_structure,
+        "react": _create_react_structure,
+        "vue": _create_vue_structure,
+        "python": _create_python_structure,
+        "node": _create_node_structure,
+    }
+    
     async def get_project_info(self, project_id: str) -> Optional[Dict[str, Any]]:
         """Get project information"""
         try:
             project_path = self.projects_base_path / project_id
             metadata_file = project_path / "project.json"
             
-            if not metadata_file.exists():
-                return None
-            
-            with open(metadata_file, 'r') as f:
-                return json.load(f)
+            info = await asyncio.to_thread(self._read_metadata_cached, project_id, metadata_file)
+            # Callers get their own copy; the cached dict stays untouched
+            return copy.deepcopy(info)
                 
         except Exception as e:
             logger.error(f"Error getting project info: {e}")
             return None
     
+    def _read_metadata_cached(self, project_id: str, metadata_file: Path) -> Optional[Dict[str, Any]]:
+        """Parsed project.json, re-read only when its mtime or size changes (runs in a worker thread)"""
+        try:
+            st = os.stat(metadata_file)
+        except (FileNotFoundError, NotADirectoryError):
+            self._metadata_cache.pop(project_id, None)
+            return None
+        
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._metadata_cache.get(project_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        
+        info = _read_metadata(metadata_file)
+        if info is not None:
+            self._metadata_cache[project_id] = (key, info)
+        return info
+    
+    def _read_projects(self, names: List[str]) -> List[Dict[str, Any]]:
+        """Copies of the metadata of every named project that has any (runs in a worker thread)"""
+        projects = []
+        for name in names:
+            info = self._read_metadata_cached(name, self.projects_base_path / name / "project.json")
+            if info:
+                projects.append(copy.deepcopy(info))
+        return projects
+    
     async def list_projects(self) -> List[Dict[str, Any]]:
         """List all projects"""
         try:
-            projects = []
-            
-            for project_dir in self.projects_base_path.iterdir():
-                if project_dir.is_dir():
-                    project_info = await self.get_project_info(project_dir.name)
-                    if project_info:
-                        projects.append(project_info)
-            
-            return sorted(projects, key=lambda x: x.get('created_at', ''), reverse=True)
+            # Creating or deleting a project directory bumps the base directory mtime
+            mtime = (await asyncio.to_thread(self.projects_base_path.stat)).st_mtime_ns
+            if self._projects_cache and self._projects_cache[0] == mtime:
+                names = self._projects_cache[1]
+            else:
+                names = await asyncio.to_thread(_list_project_dirs, self.projects_base_path)
+                self._projects_cache = (mtime, names)
+            
+            # One stat per project.json; only files changed since the last listing are parsed again
+            projects = await asyncio.to_thread(self._read_projects, names)
+            projects.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            return projects
             
         except Exception as e:
             logger.error(f"Error listing projects: {e}")
             return []
     
+    async def _update_cached_projects(self, project_id: str, metadata: Optional[Dict[str, Any]]):
+        """Add (or with None, drop) one project in the cached listing instead of rescanning"""
+        self._metadata_cache.pop(project_id, None)
+        
+        cached = self._projects_cache
+        if cached is None:
+            return
+        
+        names = [name for name in cached[1] if name != project_id]
+        if metadata is not None:
+            names.append(project_id)
+        
+        # Re-stamp with the base directory mtime our own mkdir/rmtree just changed
+        mtime = (await asyncio.to_thread(self.projects_base_path.stat)).st_mtime_ns
+        if self._projects_cache is cached:
+            self._projects_cache = (mtime, names)
+        else:
+            self._projects_cache = None
+    
     async def delete_project(self, project_id: str) -> bool:
         """Delete project workspace"""
         try:
             project_path = self.projects_base_path / project_id
             
+            install_task = self._install_tasks.pop(project_id, None)
+            if install_task and not install_task.done():
+                install_task.cancel()
+                # Let the cancelled install kill its installer before the workspace goes away
+                await asyncio.wait([install_task])
+            
             if project_path.exists():
-                shutil.rmtree(project_path)
+                await asyncio.to_thread(shutil.rmtree, project_path)
+                await self._update_cached_projects(project_id, None)
                 logger.info(f"Deleted project {project_id}")
                 return True
             
@@ -608,6 +859,30 @@ createApp(App).mount('#app')
         """Get project code path"""
         return self.projects_base_path / project_id / "code"
     
+    @asynccontextmanager
+    async def _install_slot(self, tool: str):
+        """Serialize installs sharing a package manager cache, across tasks and processes"""
+        # Tool lock first: an install queued behind its own tool must not hold one of the
+        # global slots that installs with other package managers could be using
+        async with self._install_locks[tool], self._install_semaphore:
+            fd = None
+            acquire = asyncio.ensure_future(
+                asyncio.to_thread(_acquire_file_lock, self.package_cache_path / f"{tool}-install.lock")
+            )
+            try:
+                fd = await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                # The worker thread blocked in flock cannot be interrupted; release the lock once it lands
+                acquire.add_done_callback(_release_abandoned_file_lock)
+                raise
+            except Exception as e:
+                logger.warning(f"Could not take {tool} install lock, continuing without it: {e}")
+            try:
+                yield
+            finally:
+                if fd is not None:
+                    _release_file_lock(fd)
+    
     async def install_dependencies(self, project_path: str, stack: str) -> bool:
         """Install dependencies for the project based on stack"""
         try:
@@ -616,30 +891,41 @@ createApp(App).mount('#app')
             if stack == "laravel":
                 logger.info(f"Installing Laravel dependencies for {project_path}")
                 # Run composer install in the code directory
-                result = await self._run_command(["composer", "install"], cwd=str(code_path))
+                async with self._install_slot("composer"):
+                    result = await self._run_command(
+                        ["composer", "install", "--prefer-dist", "--no-interaction"],
+                        cwd=str(code_path), env=self.cache_env
+                    )
                 if result.returncode != 0:
                     logger.warning(f"Composer install failed: {result.stderr}")
                     return False
                     
             elif stack in ["react", "vue", "node"]:
                 logger.info(f"Installing {stack} dependencies for {project_path}")
-                # Run yarn install in the code directory
-                result = await self._run_command(["yarn", "install"], cwd=str(code_path))
+                # Run pnpm/yarn install in the code directory
+                installer = self._js_installer[0]
+                async with self._install_slot(installer):
+                    result = await self._run_command(
+                        self._js_installer, cwd=str(code_path), env=self.cache_env
+                    )
                 if result.returncode != 0:
-                    logger.warning(f"Yarn install failed: {result.stderr}")
+                    logger.warning(f"{installer.capitalize()} install failed: {result.stderr}")
                     return False
                     
             elif stack == "python":
                 logger.info(f"Installing Python dependencies for {project_path}")
-                # Run pip install -r requirements.txt in the code directory
+                # Run uv/pip install -r requirements.txt in the code directory
                 requirements_file = code_path / "requirements.txt"
                 if requirements_file.exists():
-                    result = await self._run_command(
-                        ["pip", "install", "-r", "requirements.txt"], 
-                        cwd=str(code_path)
-                    )
+                    installer = self._py_installer[0]
+                    command = self._py_installer + ["-r", "requirements.txt"]
+                    # Prefer prebuilt wheels from the shared wheelhouse when present
+                    if self.wheelhouse_path.is_dir():
+                        command += ["--find-links", str(self.wheelhouse_path)]
+                    async with self._install_slot(installer):
+                        result = await self._run_command(command, cwd=str(code_path), env=self.cache_env)
                     if result.returncode != 0:
-                        logger.warning(f"Pip install failed: {result.stderr}")
+                        logger.warning(f"{installer.capitalize()} install failed: {result.stderr}")
                         return False
                 else:
                     logger.warning("No requirements.txt found for Python project")
@@ -651,23 +937,45 @@ createApp(App).mount('#app')
             logger.error(f"Error installing dependencies for {stack}: {e}")
             return False
     
-    async def _run_command(self, command: List[str], cwd: str = None):
-        """Run shell command"""
+    async def _run_command(self, command: List[str], cwd: str = None, env: Dict[str, str] = None) -> CommandResult:
+        """Run shell command, optionally with extra environment variables"""
         try:
+            # Resolve the executable once instead of a PATH search on every spawn
+            executable = self._exe_cache.get(command[0])
+            if executable is None:
+                executable = shutil.which(command[0])
+                if executable:
+                    self._exe_cache[command[0]] = executable
+                else:
+                    executable = command[0]
+            
+            # Python-created fds are non-inheritable (PEP 446), so skip the
+            # per-spawn close of every open descriptor in the child
             process = await asyncio.create_subprocess_exec(
-                *command,
+                executable, *command[1:],
                 cwd=cwd,
+                env={**os.environ, **env} if env else None,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                close_fds=False
             )
             
-            stdout, stderr = await process.communicate()
-            
-            return type(\'CommandResult\', (), {
-                \'returncode\': process.returncode,
-                \'stdout\': stdout.decode(\'utf-8\', errors=\'ignore\'),
-                \'stderr\': stderr.decode(\'utf-8\', errors=\'ignore\')
-            })()
+            stdout = deque(maxlen=_OUTPUT_TAIL_LINES)
+            stderr = deque(maxlen=_OUTPUT_TAIL_LINES)
+            try:
+                await asyncio.gather(
+                    drain_stream(process.stdout, stdout, command[0]),
+                    drain_stream(process.stderr, stderr, command[0]),
+                    process.wait()
+                )
+            except asyncio.CancelledError:
+                # Don't leave the child running (and writing into cwd) once nobody waits for it
+                if process.returncode is None:
+                    process.kill()
+                await process.wait()
+                raise
+            
+            return CommandResult(process.returncode, b"".join(stdout), b"".join(stderr))
             
         except Exception as e:
             logger.error(f"Command execution error: {e}")
@@ -1,36 +1,32 @@
 import hashlib
 import json
 import logging
+import time
 from typing import Dict, Any, Optional, List, Tuple
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from dataclasses import dataclass
-import asyncio
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class CachedPrompt:
     hash_key: str
     system_prompt: str
     created_at: datetime
-    last_used: datetime
+    last_used: int  # Manager tick of the most recent use
     usage_count: int
     provider: str  # 'openai' or 'anthropic'
+    created_mono: float  # time.monotonic() at creation, for TTL checks
     
-@dataclass 
+@dataclass(slots=True)
 class PromptDelta:
     conversation_history: List[Dict[str, str]]
     current_user_message: str
 
-class PromptCacheManager:
-    def __init__(self):
-        self.cache: Dict[str, CachedPrompt] = {}
-        self.max_cache_size = 100  # Maximum cached prompts
-        self.cache_ttl_hours = 24  # Cache time-to-live in hours
-        
-        # Standard system prompts with their hashes
-        self.system_prompts = {
-            "coding": """You are an expert AI coding agent. Generate precise, minimal code changes.
+# Standard system prompts, copied into every manager instance
+_SYSTEM_PROMPTS = {
+    "coding": """You are an expert AI coding agent. Generate precise, minimal code changes.
 Your task is to create focused patches that solve specific problems without introducing unnecessary complexity.
 
 Guidelines:
@@ -53,7 +49,7 @@ CHECKLIST
 - Performance: OK/KO
 - Comments: <brief summary of changes and reasoning>""",
 
-            "planning": """You are an AI project planning agent. Create detailed, actionable execution plans.
+    "planning": """You are an AI project planning agent. Create detailed, actionable execution plans.
 Your task is to break down complex goals into specific, measurable steps.
 
 Guidelines:
@@ -66,7 +62,7 @@ Guidelines:
 
 Format as numbered list with brief descriptions and specific deliverables.""",
 
-            "debugging": """You are an expert debugging agent. Analyze errors and provide systematic solutions.
+    "debugging": """You are an expert debugging agent. Analyze errors and provide systematic solutions.
 Your task is to identify root causes and implement comprehensive fixes.
 
 Guidelines:
@@ -79,7 +75,7 @@ Guidelines:
 
 Focus on robust solutions that prevent similar issues in the future.""",
 
-            "analysis": """You are an expert code analysis agent. Provide comprehensive insights into codebases.
+    "analysis": """You are an expert code analysis agent. Provide comprehensive insights into codebases.
 Your task is to understand structure, patterns, and provide actionable recommendations.
 
 Guidelines:
@@ -91,25 +87,39 @@ Guidelines:
 - Highlight best practices and anti-patterns
 
 Deliver structured analysis with clear priorities and implementation suggestions."""
-        }
+}
+
+def _compute_hash(text: str) -> str:
+    """Compute BLAKE2b hash of text (an in-process cache key, not a security boundary)"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+# Pre-computed once at import rather than per instance
+_SYSTEM_PROMPT_HASHES = {
+    task_type: _compute_hash(prompt)
+    for task_type, prompt in _SYSTEM_PROMPTS.items()
+}
+
+class PromptCacheManager:
+    def __init__(self):
+        # Kept in least-recently-used-first order
+        self.cache: "OrderedDict[str, CachedPrompt]" = OrderedDict()
+        self.max_cache_size = 100  # Maximum cached prompts
+        self.cache_ttl_hours = 24  # Cache time-to-live in hours
+        self._tick = 0  # Monotonic use counter backing CachedPrompt.last_used
         
-        # Pre-compute hashes for system prompts
-        self.system_prompt_hashes = {
-            task_type: self._compute_hash(prompt) 
-            for task_type, prompt in self.system_prompts.items()
-        }
+        # Standard system prompts with their hashes; shallow per-instance copies so
+        # changing one manager's prompts never leaks into another's (the strings are shared)
+        self.system_prompts = dict(_SYSTEM_PROMPTS)
+        self.system_prompt_hashes = dict(_SYSTEM_PROMPT_HASHES)
         
-    def _compute_hash(self, text: str) -> str:
-        """Compute SHA256 hash of text"""
-        return hashlib.sha256(text.encode('utf-8')).hexdigest()
-    
     def _cleanup_cache(self):
         """Remove expired cache entries"""
-        now = datetime.now(timezone.utc)
+        now = time.monotonic()
+        ttl_seconds = self.cache_ttl_hours * 3600
         expired_keys = []
         
         for key, cached_prompt in self.cache.items():
-            if now - cached_prompt.created_at > timedelta(hours=self.cache_ttl_hours):
+            if now - cached_prompt.created_mono > ttl_seconds:
                 expired_keys.append(key)
         
         for key in expired_keys:
@@ -117,66 +127,61 @@ Deliver structured analysis with clear priorities and implementation suggestions
             
         # If cache is still too large, remove least recently used
         if len(self.cache) > self.max_cache_size:
-            sorted_cache = sorted(
-                self.cache.items(),
-                key=lambda x: x[1].last_used
-            )
-            
             # Remove oldest 20% of entries
-            to_remove = len(sorted_cache) - int(self.max_cache_size * 0.8)
-            for i in range(to_remove):
-                del self.cache[sorted_cache[i][0]]
+            target_size = int(self.max_cache_size * 0.8)
+            while len(self.cache) > target_size:
+                self.cache.popitem(last=False)
                 
         logger.info(f"Cache cleanup: {len(expired_keys)} expired, {len(self.cache)} remaining")
     
-    async def prepare_openai_messages(self, task_type: str, user_prompt: str, 
-                                    conversation_history: List[Dict[str, str]] = None) -> Tuple[List[Dict[str, str]], bool]:
+    def _touch_cache(self, task_type: str, provider: str) -> Tuple[str, bool]:
+        """Record a use of the task's system prompt, returning (system_prompt, use_cache)"""
+        # Unknown task types fall back to the coding prompt
+        prompt_type = task_type if self.system_prompts.get(task_type) else "coding"
+        system_prompt = self.system_prompts[prompt_type]
+        system_hash = self.system_prompt_hashes.get(prompt_type)
+        if system_hash is None:
+            # A prompt registered without a hash gets its own, never another prompt's
+            system_hash = self.system_prompt_hashes[prompt_type] = _compute_hash(system_prompt)
+        self._tick += 1
+        
+        # Check if we can use cached system prompt
+        cached_prompt = self.cache.get(system_hash)
+        if cached_prompt:
+            # Update usage stats
+            cached_prompt.last_used = self._tick
+            self.cache.move_to_end(system_hash)
+            cached_prompt.usage_count += 1
+            logger.info(f"Using cached system prompt for {task_type} (used {cached_prompt.usage_count} times)")
+            return system_prompt, True
+        
+        # Create new cache entry
+        self.cache[system_hash] = CachedPrompt(
+            hash_key=system_hash,
+            system_prompt=system_prompt,
+            created_at=datetime.now(timezone.utc),
+            last_used=self._tick,
+            usage_count=1,
+            provider=provider,
+            created_mono=time.monotonic()
+        )
+        self._cleanup_cache()
+        logger.info(f"Created new cached system prompt for {task_type}")
+        return system_prompt, False
+    
+    def prepare_openai_messages(self, task_type: str, user_prompt: str, 
+                              conversation_history: List[Dict[str, str]] = None) -> Tuple[List[Dict[str, str]], bool]:
         """Prepare OpenAI messages with caching optimization"""
         try:
-            system_prompt = self.system_prompts.get(task_type, self.system_prompts["coding"])
-            system_hash = self.system_prompt_hashes.get(task_type, self._compute_hash(system_prompt))
+            system_prompt, use_cache = self._touch_cache(task_type, "openai")
             
-            # Check if we can use cached system prompt
-            cached_prompt = self.cache.get(system_hash)
-            use_cache = False
-            
-            if cached_prompt:
-                # Update usage stats
-                cached_prompt.last_used = datetime.now(timezone.utc)
-                cached_prompt.usage_count += 1
-                use_cache = True
-                logger.info(f"Using cached system prompt for {task_type} (used {cached_prompt.usage_count} times)")
-            else:
-                # Create new cache entry
-                self.cache[system_hash] = CachedPrompt(
-                    hash_key=system_hash,
-                    system_prompt=system_prompt,
-                    created_at=datetime.now(timezone.utc),
-                    last_used=datetime.now(timezone.utc),
-                    usage_count=1,
-                    provider="openai"
-                )
-                self._cleanup_cache()
-                logger.info(f"Created new cached system prompt for {task_type}")
-            
-            # Build message array
-            messages = []
-            
-            # Add system message (always included for OpenAI)
-            messages.append({
-                "role": "system", 
-                "content": system_prompt
-            })
-            
-            # Add conversation history if provided
+            # Build message array: system (always included for OpenAI), history, current user message
+            system_msg = {"role": "system", "content": system_prompt}
+            user_msg = {"role": "user", "content": user_prompt}
             if conversation_history:
-                messages.extend(conversation_history)
-            
-            # Add current user message
-            messages.append({
-                "role": "user",
-                "content": user_prompt
-            })
+                messages = [system_msg, *conversation_history, user_msg]
+            else:
+                messages = [system_msg, user_msg]
             
             return messages, use_cache
             
@@ -188,48 +193,18 @@ Deliver structured analysis with clear priorities and implementation suggestions
                 {"role": "user", "content": user_prompt}
             ], False
     
-    async def prepare_anthropic_messages(self, task_type: str, user_prompt: str,
-                                       conversation_history: List[Dict[str, str]] = None) -> Tuple[str, List[Dict[str, str]], bool]:
+    def prepare_anthropic_messages(self, task_type: str, user_prompt: str,
+                                 conversation_history: List[Dict[str, str]] = None) -> Tuple[str, List[Dict[str, str]], bool]:
         """Prepare Anthropic messages with caching optimization"""
         try:
-            system_prompt = self.system_prompts.get(task_type, self.system_prompts["coding"])
-            system_hash = self.system_prompt_hashes.get(task_type, self._compute_hash(system_prompt))
-            
-            # Check if we can use cached system prompt
-            cached_prompt = self.cache.get(system_hash)
-            use_cache = False
-            
-            if cached_prompt:
-                # Update usage stats
-                cached_prompt.last_used = datetime.now(timezone.utc)
-                cached_prompt.usage_count += 1 
-                use_cache = True
-                logger.info(f"Using cached system prompt for {task_type} (used {cached_prompt.usage_count} times)")
-            else:
-                # Create new cache entry
-                self.cache[system_hash] = CachedPrompt(
-                    hash_key=system_hash,
-                    system_prompt=system_prompt,
-                    created_at=datetime.now(timezone.utc),
-                    last_used=datetime.now(timezone.utc),
-                    usage_count=1,
-                    provider="anthropic"
-                )
-                self._cleanup_cache()
-                logger.info(f"Created new cached system prompt for {task_type}")
+            system_prompt, use_cache = self._touch_cache(task_type, "anthropic")
             
             # Build messages array (Anthropic separates system from messages)
-            messages = []
-            
-            # Add conversation history if provided
+            user_msg = {"role": "user", "content": user_prompt}
             if conversation_history:
-                messages.extend(conversation_history)
-            
-            # Add current user message
-            messages.append({
-                "role": "user",
-                "content": user_prompt
-            })
+                messages = [*conversation_history, user_msg]
+            else:
+                messages = [user_msg]
             
             return system_prompt, messages, use_cache
             
@@ -252,11 +227,20 @@ Deliver structured analysis with clear priorities and implementation suggestions
                 "most_used": None
             }
             
-        total_usage = sum(prompt.usage_count for prompt in self.cache.values())
-        most_used = max(self.cache.values(), key=lambda x: x.usage_count)
+        # Single pass; usage > 1 means cache hit
+        total_usage = 0
+        cache_hits = 0
+        most_used = None
+        best = -1
+        for prompt in self.cache.values():
+            count = prompt.usage_count
+            total_usage += count
+            if count > 1:
+                cache_hits += 1
+            if count > best:
+                best, most_used = count, prompt
         
-        # Calculate hit rate (usage > 1 means cache hit)
-        cache_hits = sum(1 for prompt in self.cache.values() if prompt.usage_count > 1)
+        # Calculate hit rate
         hit_rate = cache_hits / len(self.cache) if self.cache else 0.0
         
         return {
@@ -283,13 +267,20 @@ Deliver structured analysis with clear priorities and implementation suggestions
                 "savings_percentage": 0.0
             }
             
+        # Count cache hits and total requests in one pass
+        cache_hits = 0
+        total_usage = 0
+        for prompt in self.cache.values():
+            count = prompt.usage_count
+            total_usage += count
+            if count > 1:
+                cache_hits += count - 1
+        
         # Calculate tokens saved from cache hits
-        cache_hits = sum(max(0, prompt.usage_count - 1) for prompt in self.cache.values())
         tokens_saved = cache_hits * avg_system_prompt_tokens
         cost_saved = (tokens_saved / 1000) * cost_per_1k_tokens * 0.85  # Convert USD to EUR
         
         # Estimate total tokens that would have been used without caching
-        total_usage = sum(prompt.usage_count for prompt in self.cache.values())
         total_tokens_without_cache = total_usage * avg_system_prompt_tokens
         
         savings_percentage = (tokens_saved / total_tokens_without_cache * 100) if total_tokens_without_cache > 0 else 0.0
@@ -302,7 +293,7 @@ Deliver structured analysis with clear priorities and implementation suggestions
             "total_requests": total_usage
         }
     
-    async def clear_cache(self):
+    def clear_cache(self):
         """Clear all cached prompts"""
         cleared_count = len(self.cache)
         self.cache.clear()
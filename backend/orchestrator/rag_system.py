@@ -1,24 +1,228 @@
 import os
+import re
+import asyncio
+import functools
+import math
+import mmap
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 import json
+import pickle
 import hashlib
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from array import array
+from itertools import compress
 
 logger = logging.getLogger(__name__)
 
+# Embedding width of all-MiniLM-L6-v2
+EMBEDDING_DIM = 384
+
+# Content types and their keywords, highest priority first
+_CONTENT_TYPES = (
+    ("code", ('function', 'class', 'method', 'def ', 'public ', 'private ')),
+    ("test", ('test', 'spec', 'describe', 'it(')),
+    ("documentation", ('#', 'readme', 'documentation')),
+    ("configuration", ('config', 'setting', 'env')),
+)
+_CONTENT_TYPE_RANK = {name: rank for rank, (name, _) in enumerate(_CONTENT_TYPES)}
+
+# Zero-width lookahead so overlapping keywords (e.g. "readme" in "readmethod") are all seen.
+# ASCII-only case folding matches what str.lower() does to these keywords; Unicode folding
+# would also match e.g. "ſ" (long s) as "s" or "K" (Kelvin sign) as "k"
+_CONTENT_TYPE_RE = re.compile(
+    "(?=" + "|".join(
+        f"(?P<{name}>{'|'.join(re.escape(keyword) for keyword in keywords)})"
+        for name, keywords in _CONTENT_TYPES
+    ) + ")",
+    re.ASCII | re.IGNORECASE
+)
+
+# Normalized embeddings lie in [-1, 1] per dimension; the 8-bit scalar
+# quantizer is trained on exactly that range so no batch can fall outside it
+_SQ_TRAINING_RANGE = np.array([[-1.0] * EMBEDDING_DIM, [1.0] * EMBEDDING_DIM], dtype='float32')
+
+_INDEXABLE_EXTENSIONS = frozenset({
+    '.php', '.js', '.ts', '.jsx', '.tsx', '.vue', '.py', 
+    '.md', '.txt', '.json', '.yaml', '.yml', '.env.example',
+    '.blade.php', '.twig'
+})
+
+# Special files without extensions
+_INDEXABLE_NAMES = frozenset({'readme', 'makefile', 'dockerfile', 'composer.json', 'package.json'})
+
+# Directories pruned wherever they appear, plus paths pruned relative to the project root
+_IGNORED_DIRS = frozenset({
+    'node_modules', 'vendor', '.git', 'storage', '.next', 'dist', 'build', '__pycache__'
+})
+_IGNORED_PATHS = frozenset({'bootstrap/cache', 'public/storage'})
+
+_MAX_INDEXED_FILES = 100
+
+# Files above this size are memory-mapped rather than read through a buffered file
+_MMAP_THRESHOLD = 64 * 1024
+
+# Zero-copy mmap where this FAISS build supports it; pages come from the page cache, not the heap
+_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+# Recent query embeddings kept in memory; longer queries are encoded every time
+_QUERY_CACHE_SIZE = 512
+_QUERY_CACHE_MAX_CHARS = 2048
+
+# IVFPQ training needs a point per 8-bit PQ centroid (and more than its nlist coarse centroids)
+_IVFPQ_MIN_TRAINING_VECTORS = 256
+
+def _walk_indexable(directory: Path, relative: str) -> Iterator[Tuple[Path, os.stat_result]]:
+    """Yield (path, stat) of indexable files, never descending into ignored directories"""
+    subdirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                entry_relative = f"{relative}{entry.name}"
+                if entry.name not in _IGNORED_DIRS and entry_relative not in _IGNORED_PATHS:
+                    subdirs.append((entry.name, entry_relative))
+                continue
+            
+            if not entry.is_file():
+                continue
+            
+            name = entry.name.lower()
+            if os.path.splitext(name)[1] in _INDEXABLE_EXTENSIONS or name in _INDEXABLE_NAMES:
+                # DirEntry caches the stat, so the size comes without a second lookup later
+                yield directory / entry.name, entry.stat()
+    
+    for name, entry_relative in subdirs:
+        yield from _walk_indexable(directory / name, f"{entry_relative}/")
+
+def _flat_sq_index() -> faiss.IndexScalarQuantizer:
+    """Exhaustive inner-product index over 8-bit scalar-quantized codes"""
+    index = faiss.IndexScalarQuantizer(EMBEDDING_DIM, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    index.train(_SQ_TRAINING_RANGE)
+    return index
+
+def _corpus_fingerprint(files: List[Tuple[Path, os.stat_result]]) -> str:
+    """Digest of the paths, sizes and modification times of a project's indexable files"""
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path, file_stat in files:
+        digest.update(f"{file_path}\0{file_stat.st_size}\0{file_stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _write_unique_file(directory: Path, suffix: str, data) -> str:
+    """Write data to a new, uniquely named file in directory and return its name"""
+    fd, path = tempfile.mkstemp(prefix="index-", suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(path)
+        raise
+    return os.path.basename(path)
+
+def _read_manifest(manifest_path: Path) -> Optional[Dict[str, str]]:
+    """File names of the current index/metadata pair, if a snapshot has been saved"""
+    try:
+        with open(manifest_path, 'rb') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_snapshot(manifest_path: Path, index_bytes, metadata_bytes: bytes) -> None:
+    """Write a new index/metadata pair and switch the manifest to it (blocking, run in a worker thread)"""
+    directory = manifest_path.parent
+    directory.mkdir(parents=True, exist_ok=True)
+    previous = _read_manifest(manifest_path)
+    
+    # Unique names, so concurrent writers (other worker processes) never share a file;
+    # the pair only becomes visible through the single manifest rename below
+    written = []
+    try:
+        written.append(_write_unique_file(directory, ".faiss", index_bytes))
+        written.append(_write_unique_file(directory, ".pkl", metadata_bytes))
+        manifest = json.dumps({"index": written[0], "metadata": written[1]}).encode('utf-8')
+        written.append(_write_unique_file(directory, ".json.tmp", manifest))
+        os.replace(directory / written[-1], manifest_path)
+    except BaseException:
+        for name in written:
+            (directory / name).unlink(missing_ok=True)
+        raise
+    
+    # Processes that mapped the previous pair keep their mapping after the unlink
+    if previous:
+        for name in previous.values():
+            (directory / name).unlink(missing_ok=True)
+
 class RAGSystem:
     def __init__(self):
         self.model = None
         self.index = None
         self.documents = []
-        self.document_metadata = []
-        self.embeddings_cache = {}
+        # Chunk metadata stored column-wise: compact per-chunk ids into small interned tables
+        self.sources: List[Any] = []
+        self._source_ids: Dict[Any, int] = {}
+        self.source_ids = array('I')
+        self.content_type_names: List[str] = []
+        self._content_type_ids: Dict[str, int] = {}
+        self.content_types = array('B')
+        self.chunk_indices = array('I')
+        # In-process LRU of text hash -> float16 embedding, in front of the on-disk cache
+        self.embeddings_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.embeddings_cache_size = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "5000"))
         self.model_name = "all-MiniLM-L6-v2"  # Lightweight model
+        # "torch" (fp16 when a GPU is available) or "onnx" (ONNX Runtime on CPU,
+        # optionally a quantized export such as onnx/model_qint8_avx512.onnx via RAG_ONNX_FILE)
+        self.model_backend = os.getenv("RAG_MODEL_BACKEND", "torch").lower()
+        self.onnx_file = os.getenv("RAG_ONNX_FILE")
         self.initialized = False
+        # Per instance, so cached vectors never outlive the model that produced them
+        self._encode_query_cached = functools.lru_cache(maxsize=_QUERY_CACHE_SIZE)(self._encode_query)
+        
+        # "flat" (exhaustive), "hnsw" (graph), "ivfpq" (compressed, trained once
+        # RAG_IVFPQ_THRESHOLD vectors exist), or "auto": flat for small corpora,
+        # HNSW from RAG_HNSW_THRESHOLD vectors and IVFPQ from RAG_IVFPQ_THRESHOLD
+        self.index_type = os.getenv("RAG_INDEX_TYPE", "auto").lower()
+        self.hnsw_threshold = int(os.getenv("RAG_HNSW_THRESHOLD", "1000"))
+        self.ivfpq_threshold = int(os.getenv("RAG_IVFPQ_THRESHOLD", "50000"))
+        if self.ivfpq_threshold < _IVFPQ_MIN_TRAINING_VECTORS:
+            logger.warning(
+                f"RAG_IVFPQ_THRESHOLD={self.ivfpq_threshold} is too small to train IVFPQ, "
+                f"using {_IVFPQ_MIN_TRAINING_VECTORS}"
+            )
+            self.ivfpq_threshold = _IVFPQ_MIN_TRAINING_VECTORS
+        self.index_kind = None
+        # The flat tier is split across this many shards scanned in parallel threads,
+        # since a single query otherwise only ever uses one core. By default only when
+        # the flat tier can grow large: in auto mode it becomes HNSW at hnsw_threshold
+        # vectors, too few for the thread fan-out and id maps to pay off
+        default_shards = (os.cpu_count() or 1) if self.index_type in ("flat", "ivfpq") else 1
+        self.index_shards = int(os.getenv("RAG_INDEX_SHARDS", str(default_shards)))
+        
+        # Embeddings persisted across restarts, keyed by (model, sha256 of chunk text)
+        cache_dir = Path(os.getenv("RAG_CACHE_DIR", "/app/cache/rag"))
+        self.embedding_cache_path = cache_dir / "embeddings.sqlite3"
+        self._embedding_db: Optional[sqlite3.Connection] = None
+        
+        # Snapshot of the index and chunk metadata, memory-mapped back in on restart;
+        # projects whose files are unchanged since then are not re-indexed. The
+        # manifest names the current index/metadata pair, so both change together
+        self.snapshot_manifest_path = cache_dir / "index.json"
+        self.project_fingerprints: Dict[str, Tuple[str, int]] = {}
+        # Per file: (mtime_ns, size) when it was indexed and the ids of its chunks;
+        # chunks of files that later change or disappear are tombstoned until compaction
+        self._file_fingerprints: Dict[str, Tuple[int, int]] = {}
+        self._file_chunk_ids: Dict[str, range] = {}
+        self._tombstones: set = set()
+        self._index_mmapped = False
+        self._save_lock = asyncio.Lock()
+        # Serializes changes to the index and chunk columns, since rebuilds run in a worker thread
+        self._index_lock = asyncio.Lock()
     
     async def initialize(self):
         """Initialize the RAG system"""
@@ -27,13 +231,17 @@ class RAGSystem:
                 return
             
             logger.info("Initializing RAG system...")
-            self.model = SentenceTransformer(self.model_name)
+            self.model = self._load_model()
             
-            # Create FAISS index (384 dimensions for all-MiniLM-L6-v2)
-            self.index = faiss.IndexFlatIP(384)
+            # Restore the last snapshot, or create an empty FAISS index (384 dimensions for all-MiniLM-L6-v2)
+            restored = self._load_snapshot()
+            if not restored:
+                self._reset_index()
+            self._open_embedding_cache()
             
-            # Load framework documentation if available
-            await self._load_framework_docs()
+            # Load framework documentation if available (a restored snapshot already has it)
+            if not restored:
+                await self._load_framework_docs()
             
             self.initialized = True
             logger.info("RAG system initialized successfully")
@@ -42,6 +250,28 @@ class RAGSystem:
             logger.error(f"Error initializing RAG system: {e}")
             self.initialized = False
     
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Query embedding, normalized in place like the indexed vectors"""
+        query_embedding = np.ascontiguousarray(self.model.encode([query]), dtype='float32')
+        faiss.normalize_L2(query_embedding)
+        # Shared through the query cache, so never mutated afterwards
+        query_embedding.setflags(write=False)
+        return query_embedding
+    
+    def _load_model(self) -> SentenceTransformer:
+        """Load the embedding model on the fastest backend available"""
+        if self.model_backend == "onnx":
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            if self.onnx_file:
+                model_kwargs["file_name"] = self.onnx_file
+            return SentenceTransformer(self.model_name, backend="onnx", model_kwargs=model_kwargs)
+        
+        model = SentenceTransformer(self.model_name)
+        if model.device.type == "cuda":
+            # Half precision doubles GPU encode throughput at no measurable retrieval cost
+            model.half()
+        return model
+    
     async def index_project(self, project_path: str) -> int:
         """Index a project's files for RAG"""
         try:
@@ -56,22 +286,41 @@ class RAGSystem:
                 logger.warning(f"Project path does not exist: {project_path}")
                 return 0
             
-            indexed_count = 0
-            
-            # Index relevant files
-            for file_path in self._get_indexable_files(project_path):
-                try:
-                    content = self._read_file_content(file_path)
-                    if content:
-                        chunks = self._chunk_content(content, file_path)
-                        await self._add_chunks_to_index(chunks, file_path)
-                        indexed_count += len(chunks)
-                        
-                except Exception as e:
-                    logger.warning(f"Error indexing file {file_path}: {e}")
-                    continue
-            
-            logger.info(f"Indexed {indexed_count} chunks from project {project_path}")
+            files = await asyncio.to_thread(self._get_indexable_files, project_path)
+            
+            fingerprint = _corpus_fingerprint(files)
+            indexed = self.project_fingerprints.get(str(project_path))
+            if indexed and indexed[0] == fingerprint:
+                logger.info(f"Project {project_path} is unchanged since it was indexed")
+                return indexed[1]
+            
+            # Retire chunks of files modified or deleted since the last run; files
+            # whose fingerprint still matches keep their chunks and are skipped
+            async with self._index_lock:
+                await self._retire_stale_files(project_path, files)
+            pending = [(file_path, file_stat) for file_path, file_stat in files if str(file_path) not in self._file_fingerprints]
+            
+            # Read and chunk every new or modified file concurrently in worker threads,
+            # then embed them in one batch
+            file_chunks = await asyncio.gather(*(
+                asyncio.to_thread(self._load_file_chunks, file_path, file_stat.st_size)
+                for file_path, file_stat in pending
+            ))
+            chunks = [chunk for chunks_of_file in file_chunks for chunk in chunks_of_file]
+            
+            first_id = await self._add_chunks_to_index(chunks)
+            if first_id is not None:
+                for (file_path, file_stat), chunks_of_file in zip(pending, file_chunks):
+                    self._file_fingerprints[str(file_path)] = (file_stat.st_mtime_ns, file_stat.st_size)
+                    self._file_chunk_ids[str(file_path)] = range(first_id, first_id + len(chunks_of_file))
+                    first_id += len(chunks_of_file)
+            
+            indexed_count = sum(len(self._file_chunk_ids.get(str(file_path), ())) for file_path, _ in files)
+            if all(str(file_path) in self._file_fingerprints for file_path, _ in files):
+                self.project_fingerprints[str(project_path)] = (fingerprint, indexed_count)
+            await self._save_snapshot()
+            
+            logger.info(f"Indexed {len(chunks)} new chunks from project {project_path} ({indexed_count} total)")
             return indexed_count
             
         except Exception as e:
@@ -84,22 +333,29 @@ class RAGSystem:
             if not self.initialized or self.index.ntotal == 0:
                 return ""
             
-            # Generate query embedding
-            query_embedding = self.model.encode([query])
+            # Generate query embedding; repeated queries skip the forward pass
+            if len(query) <= _QUERY_CACHE_MAX_CHARS:
+                query_embedding = self._encode_query_cached(query)
+            else:
+                query_embedding = self._encode_query(query)
             
-            # Search for similar chunks
-            scores, indices = self.index.search(query_embedding, min(max_chunks, self.index.ntotal))
+            # Search for similar chunks, over-fetching so retired ones can be dropped
+            k = min(max_chunks + len(self._tombstones), self.index.ntotal)
+            scores, indices = self.index.search(query_embedding, k)
             
             relevant_chunks = []
             for score, idx in zip(scores[0], indices[0]):
+                if idx in self._tombstones:
+                    continue
                 if idx < len(self.documents) and score > 0.3:  # Similarity threshold
                     chunk = self.documents[idx]
-                    metadata = self.document_metadata[idx]
                     relevant_chunks.append({
                         "content": chunk,
-                        "file": metadata.get("file_path", "unknown"),
+                        "file": self.sources[self.source_ids[idx]],
                         "score": float(score)
                     })
+                    if len(relevant_chunks) == max_chunks:
+                        break
             
             # Format context
             if not relevant_chunks:
@@ -125,7 +381,8 @@ class RAGSystem:
                 return False
             
             chunks = self._chunk_content(doc_content, doc_name)
-            await self._add_chunks_to_index(chunks, doc_name)
+            await self._add_chunks_to_index(chunks)
+            await self._save_snapshot()
             
             logger.info(f"Added {len(chunks)} documentation chunks for {doc_name}")
             return True
@@ -134,46 +391,43 @@ class RAGSystem:
             logger.error(f"Error adding documentation: {e}")
             return False
     
-    def _get_indexable_files(self, project_path: Path) -> List[Path]:
-        """Get list of files that should be indexed"""
-        indexable_extensions = {
-            '.php', '.js', '.ts', '.jsx', '.tsx', '.vue', '.py', 
-            '.md', '.txt', '.json', '.yaml', '.yml', '.env.example',
-            '.blade.php', '.twig'
-        }
-        
-        ignore_dirs = {
-            'node_modules', 'vendor', '.git', 'storage', 'bootstrap/cache',
-            'public/storage', '.next', 'dist', 'build', '__pycache__'
-        }
-        
+    def _get_indexable_files(self, project_path: Path) -> List[Tuple[Path, os.stat_result]]:
+        """Get list of files (with their stats) that should be indexed"""
         indexable_files = []
         
-        for file_path in project_path.rglob('*'):
-            if not file_path.is_file():
-                continue
-            
-            # Skip ignored directories
-            if any(ignore_dir in file_path.parts for ignore_dir in ignore_dirs):
-                continue
-            
-            # Check extension
-            if file_path.suffix.lower() in indexable_extensions:
-                indexable_files.append(file_path)
-            
-            # Special files without extensions
-            if file_path.name.lower() in {'readme', 'makefile', 'dockerfile', 'composer.json', 'package.json'}:
-                indexable_files.append(file_path)
+        for file_path, file_stat in _walk_indexable(project_path, ""):
+            indexable_files.append((file_path, file_stat))
+            if len(indexable_files) >= _MAX_INDEXED_FILES:  # Limit to prevent overload
+                break
+        
+        return indexable_files
+    
+    def _load_file_chunks(self, file_path: Path, size: int) -> List[Dict[str, Any]]:
+        """Read and chunk a single file (blocking, run in a worker thread)"""
+        try:
+            content = self._read_file_content(file_path, size)
+            if content:
+                return self._chunk_content(content, file_path)
+                
+        except Exception as e:
+            logger.warning(f"Error indexing file {file_path}: {e}")
         
-        return indexable_files[:100]  # Limit to prevent overload
+        return []
     
-    def _read_file_content(self, file_path: Path) -> Optional[str]:
+    def _read_file_content(self, file_path: Path, size: int) -> Optional[str]:
         """Read file content safely"""
         try:
             # Skip large files
-            if file_path.stat().st_size > 1024 * 1024:  # 1MB limit
+            if size > 1024 * 1024:  # 1MB limit
                 return None
             
+            if size > _MMAP_THRESHOLD:
+                # Decode straight from the mapped pages instead of buffering a bytes copy
+                with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    content = str(mm, 'utf-8', 'ignore')
+                # Same universal-newline handling as text mode
+                return content.replace('\r\n', '\n').replace('\r', '\n')
+            
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 return f.read()
                 
@@ -188,81 +442,452 @@ class RAGSystem:
         
         chunks = []
         
-        # Split by lines first
-        lines = content.split('\n')
-        current_chunk = ""
+        # The current chunk is always the slice content[start:end]; walk the line
+        # boundaries and slice once per chunk instead of concatenating line by line
+        start = end = 0
+        line_start = 0
+        content_length = len(content)
         
-        for line in lines:
-            if len(current_chunk) + len(line) > max_chunk_size and current_chunk:
+        while True:
+            line_end = content.find('\n', line_start)
+            if line_end == -1:
+                line_end = content_length
+            current_length = end - start
+            
+            if current_length + (line_end - line_start) > max_chunk_size and current_length:
                 # Create chunk
+                current_chunk = content[start:end]
                 chunks.append({
                     "content": current_chunk.strip(),
                     "source": source,
-                    "type": self._detect_content_type(current_chunk)
+                    "type": self._detect_content_type(current_chunk),
+                    "chunk_index": len(chunks)
                 })
                 
-                # Start new chunk with overlap
-                if len(current_chunk) > overlap:
-                    current_chunk = current_chunk[-overlap:] + "\n" + line
-                else:
-                    current_chunk = line
-            else:
-                current_chunk += "\n" + line if current_chunk else line
+                # Start new chunk with overlap (the newline before this line is kept)
+                start = end - overlap if current_length > overlap else line_start
+            elif not current_length:
+                start = line_start
+            end = line_end
+            
+            if line_end == content_length:
+                break
+            line_start = line_end + 1
         
         # Add final chunk
+        current_chunk = content[start:end]
         if current_chunk.strip():
             chunks.append({
                 "content": current_chunk.strip(),
                 "source": source,
-                "type": self._detect_content_type(current_chunk)
+                "type": self._detect_content_type(current_chunk),
+                "chunk_index": len(chunks)
             })
         
         return chunks
     
     def _detect_content_type(self, content: str) -> str:
         """Detect the type of content"""
-        content_lower = content.lower()
-        
-        if any(keyword in content_lower for keyword in ['function', 'class', 'method', 'def ', 'public ', 'private ']):
-            return "code"
-        elif any(keyword in content_lower for keyword in ['test', 'spec', 'describe', 'it(']):
-            return "test"  
-        elif any(keyword in content_lower for keyword in ['#', 'readme', 'documentation']):
-            return "documentation"
-        elif any(keyword in content_lower for keyword in ['config', 'setting', 'env']):
-            return "configuration"
-        else:
-            return "general"
+        # One case-insensitive scan; the highest-priority keyword anywhere wins
+        best_rank = len(_CONTENT_TYPES)
+        for match in _CONTENT_TYPE_RE.finditer(content):
+            best_rank = min(best_rank, _CONTENT_TYPE_RANK[match.lastgroup])
+            if best_rank == 0:
+                break
+        return _CONTENT_TYPES[best_rank][0] if best_rank < len(_CONTENT_TYPES) else "general"
     
-    async def _add_chunks_to_index(self, chunks: List[Dict[str, Any]], source: str):
-        """Add chunks to the FAISS index"""
+    async def _add_chunks_to_index(self, chunks: List[Dict[str, Any]]) -> Optional[int]:
+        """Add chunks (from any number of sources) to the FAISS index, returning the id of the first"""
         try:
             if not chunks:
-                return
+                return len(self.documents)
             
             # Extract content for embedding
             texts = [chunk["content"] for chunk in chunks]
             
-            # Generate embeddings
-            embeddings = self.model.encode(texts)
+            # Generate embeddings, reusing any already computed for identical text
+            embeddings = self._embed_texts(texts)
+            
+            async with self._index_lock:
+                # Add to index; a corpus that outgrows the current kind gets a new index
+                # built aside (off the event loop), so a failure leaves the index and metadata untouched
+                self._ensure_writable_index()
+                kind = self._target_index_kind(self.index.ntotal + len(embeddings))
+                if kind == self.index_kind:
+                    self.index.add(embeddings)
+                else:
+                    vectors = np.concatenate((self._reconstruct_all(), embeddings))
+                    self.index = await asyncio.to_thread(self._build_index, kind, vectors)
+                    self.index_kind = kind
+                
+                # Store documents and metadata
+                first_id = len(self.documents)
+                self.documents.extend(texts)
+                for chunk in chunks:
+                    self.source_ids.append(self._intern_source(chunk["source"]))
+                    self.content_types.append(self._intern_content_type(chunk["type"]))
+                    self.chunk_indices.append(chunk["chunk_index"])
+                return first_id
+                
+        except Exception as e:
+            logger.error(f"Error adding chunks to index: {e}")
+            return None
+    
+    def _intern_source(self, source: Any) -> int:
+        """Id of a chunk source, shared by every chunk of the same file"""
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return source_id
+    
+    def _intern_content_type(self, content_type: str) -> int:
+        """Id of a content type name"""
+        type_id = self._content_type_ids.get(content_type)
+        if type_id is None:
+            type_id = self._content_type_ids[content_type] = len(self.content_type_names)
+            self.content_type_names.append(content_type)
+        return type_id
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Normalized float32 embeddings for texts, encoding only those not in the cache"""
+        # Identical chunks (license headers, boilerplate) are looked up and encoded once
+        unique_rows: Dict[bytes, int] = {}
+        unique_texts = []
+        rows = []
+        for text in texts:
+            text_hash = hashlib.sha256(text.encode('utf-8')).digest()
+            row = unique_rows.get(text_hash)
+            if row is None:
+                row = unique_rows[text_hash] = len(unique_texts)
+                unique_texts.append(text)
+            rows.append(row)
+        
+        hashes = list(unique_rows)
+        embeddings = np.empty((len(hashes), EMBEDDING_DIM), dtype='float32')
+        
+        # Memory first, then disk for whatever memory misses
+        missing = []
+        for i, text_hash in enumerate(hashes):
+            vector = self._cache_get(text_hash)
+            if vector is None:
+                missing.append(i)
+            else:
+                embeddings[i] = vector
+        
+        cached = self._load_cached_embeddings([hashes[i] for i in missing]) if missing else {}
+        uncached = []
+        for i in missing:
+            vector = cached.get(hashes[i])
+            if vector is None:
+                uncached.append(i)
+            else:
+                embeddings[i] = vector
+                self._cache_put(hashes[i], vector)
+        
+        if uncached:
+            # One batched call, normalized for cosine similarity
+            fresh = self.model.encode(
+                [unique_texts[i] for i in uncached],
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            embeddings[uncached] = fresh
+            self._store_cached_embeddings([hashes[i] for i in uncached], embeddings[uncached])
+            for i in uncached:
+                self._cache_put(hashes[i], embeddings[i])
+        
+        # Cached vectors come back from float16; restore unit length in place
+        if len(uncached) < len(hashes):
+            faiss.normalize_L2(embeddings)
+        
+        # Scatter back to one row per input text
+        return embeddings if len(hashes) == len(texts) else embeddings[rows]
+    
+    def _cache_get(self, text_hash: bytes) -> Optional[np.ndarray]:
+        """Look up an embedding in the in-process LRU"""
+        vector = self.embeddings_cache.get(text_hash)
+        if vector is not None:
+            self.embeddings_cache.move_to_end(text_hash)
+        return vector
+    
+    def _cache_put(self, text_hash: bytes, vector: np.ndarray):
+        """Remember an embedding (as float16, half the memory), evicting the least recently used"""
+        self.embeddings_cache[text_hash] = vector.astype(np.float16)
+        self.embeddings_cache.move_to_end(text_hash)
+        while len(self.embeddings_cache) > self.embeddings_cache_size:
+            self.embeddings_cache.popitem(last=False)
+    
+    def _open_embedding_cache(self):
+        """Open (creating if needed) the on-disk embedding cache; RAG works without it"""
+        try:
+            self.embedding_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.embedding_cache_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash BLOB NOT NULL, vec BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+            )
+            db.commit()
+            self._embedding_db = db
+        except Exception as e:
+            logger.warning(f"Embedding cache disabled: {e}")
+            self._embedding_db = None
+    
+    def _load_cached_embeddings(self, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Fetch cached vectors for the given text hashes"""
+        found = {}
+        if self._embedding_db is None:
+            return found
+        
+        try:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._embedding_db.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                )
+                for text_hash, vec in rows:
+                    found[text_hash] = np.frombuffer(vec, dtype='float32')
+        except Exception as e:
+            logger.warning(f"Error reading embedding cache: {e}")
+        
+        return found
+    
+    def _store_cached_embeddings(self, hashes: List[bytes], embeddings: np.ndarray):
+        """Persist freshly computed vectors"""
+        if self._embedding_db is None:
+            return
+        
+        try:
+            self._embedding_db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vec) VALUES (?, ?, ?)",
+                [(self.model_name, text_hash, vector.tobytes()) for text_hash, vector in zip(hashes, embeddings)]
+            )
+            self._embedding_db.commit()
+        except Exception as e:
+            logger.warning(f"Error writing embedding cache: {e}")
+    
+    def _target_index_kind(self, ntotal: int) -> str:
+        """Index kind the configured policy wants for a corpus of ntotal vectors"""
+        if self.index_type in ("flat", "hnsw"):
+            return self.index_type
+        if ntotal >= self.ivfpq_threshold:
+            return "ivfpq"
+        if self.index_type == "ivfpq":
+            # IVFPQ needs training data; search exhaustively until there is enough
+            return "flat"
+        return "hnsw" if ntotal >= self.hnsw_threshold else "flat"
+    
+    def _create_index(self, kind: str, vectors: Optional[np.ndarray] = None):
+        """Build an empty inner-product index of the given kind (IVFPQ is trained on vectors)"""
+        if kind == "ivfpq":
+            # 16 sub-quantizers x 8 bits: 16 bytes per vector instead of 1536
+            nlist = max(2 * int(math.sqrt(len(vectors))), 20)
+            quantizer = faiss.IndexFlatIP(EMBEDDING_DIM)
+            index = faiss.IndexIVFPQ(quantizer, EMBEDDING_DIM, nlist, 16, 8, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            index.nprobe = min(nlist // 4, 10)
+            return index
+        
+        # Flat and HNSW tiers store int8 codes: a quarter of the bytes per distance computation
+        if kind == "hnsw":
+            index = faiss.IndexHNSWSQ(EMBEDDING_DIM, faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 100
+            index.hnsw.efSearch = 64
+            index.train(_SQ_TRAINING_RANGE)
+            return index
+        
+        if self.index_shards <= 1:
+            return _flat_sq_index()
+        
+        # Each add is split evenly across the shards with global ids, and every
+        # search scans all shards concurrently before merging their top hits
+        index = faiss.IndexShards(EMBEDDING_DIM, True, False)
+        for _ in range(self.index_shards):
+            index.add_shard(faiss.IndexIDMap2(_flat_sq_index()))
+        return index
+    
+    def _reset_index(self):
+        """Start over with an empty index of the kind an empty corpus gets"""
+        self.index_kind = self._target_index_kind(0)
+        self.index = self._create_index(self.index_kind)
+        self._index_mmapped = False
+    
+    def _build_index(self, kind: str, vectors: np.ndarray):
+        """New index of the given kind holding vectors; the current index is not touched"""
+        index = self._create_index(kind, vectors)
+        index.add(vectors)
+        logger.info(f"Rebuilt RAG index as {kind} with {index.ntotal} vectors")
+        return index
+    
+    def _reconstruct_all(self) -> np.ndarray:
+        """Decode every stored vector, in id order"""
+        if not isinstance(self.index, faiss.IndexShards):
+            return self.index.reconstruct_n(0, self.index.ntotal)
+        
+        vectors = np.empty((self.index.ntotal, EMBEDDING_DIM), dtype='float32')
+        for i in range(self.index.count()):
+            shard = faiss.downcast_index(self.index.at(i))
+            if shard.ntotal:
+                vectors[faiss.vector_to_array(shard.id_map)] = shard.index.reconstruct_n(0, shard.ntotal)
+        return vectors
+    
+    async def _retire_stale_files(self, project_path: Path, files: List[Tuple[Path, os.stat_result]]):
+        """Tombstone the chunks of a project's files that changed or disappeared since they were indexed"""
+        current = {str(file_path): (file_stat.st_mtime_ns, file_stat.st_size) for file_path, file_stat in files}
+        prefix = os.path.join(str(project_path), "")
+        
+        stale = [
+            key for key, file_fingerprint in self._file_fingerprints.items()
+            if key.startswith(prefix) and current.get(key) != file_fingerprint
+        ]
+        for key in stale:
+            del self._file_fingerprints[key]
+            for chunk_id in self._file_chunk_ids.pop(key):
+                self._tombstones.add(chunk_id)
+                self.documents[chunk_id] = ""
+        
+        if len(self._tombstones) * 2 > len(self.documents):
+            await self._compact_index()
+    
+    async def _compact_index(self):
+        """Rebuild the index and chunk columns without tombstoned chunks (caller holds _index_lock)"""
+        keep = np.ones(len(self.documents), dtype=bool)
+        keep[list(self._tombstones)] = False
+        vectors = await self._surviving_vectors(keep)
+        
+        # Built aside off the event loop like a promotion, then swapped in with the columns
+        kind = self._target_index_kind(len(vectors))
+        index = await asyncio.to_thread(self._build_index, kind, vectors)
+        self.index, self.index_kind, self._index_mmapped = index, kind, False
+        
+        mask = keep.tolist()
+        self.documents = list(compress(self.documents, mask))
+        self.source_ids = array('I', compress(self.source_ids, mask))
+        self.content_types = array('B', compress(self.content_types, mask))
+        self.chunk_indices = array('I', compress(self.chunk_indices, mask))
+        
+        # Surviving ids shift down by the number of retired ids before them
+        new_ids = np.concatenate(([0], np.cumsum(keep)))
+        self._file_chunk_ids = {
+            key: range(int(new_ids[chunk_ids.start]), int(new_ids[chunk_ids.start]) + len(chunk_ids))
+            for key, chunk_ids in self._file_chunk_ids.items()
+        }
+        logger.info(f"Compacted RAG index, dropped {len(self._tombstones)} retired chunks")
+        self._tombstones = set()
+    
+    async def _surviving_vectors(self, keep: np.ndarray) -> np.ndarray:
+        """Embeddings of the chunks to keep, as originally computed where the on-disk cache has them"""
+        survivors = np.flatnonzero(keep)
+        hashes = await asyncio.to_thread(
+            lambda: [hashlib.sha256(self.documents[i].encode('utf-8')).digest() for i in survivors]
+        )
+        cached = self._load_cached_embeddings(list(dict.fromkeys(hashes)))
+        
+        vectors = np.empty((len(survivors), EMBEDDING_DIM), dtype='float32')
+        missing = []
+        for row, text_hash in enumerate(hashes):
+            vector = cached.get(text_hash)
+            if vector is None:
+                missing.append(row)
+            else:
+                vectors[row] = vector
+        
+        # Only uncached chunks fall back to decoding the index; retraining on decoded
+        # (quantized) vectors would add error with every compaction
+        if missing:
+            decoded = await asyncio.to_thread(self._reconstruct_all)
+            vectors[missing] = decoded[survivors[missing]]
+        return vectors
+    
+    def _ensure_writable_index(self):
+        """Swap a memory-mapped index for an in-memory copy before it is modified"""
+        if not self._index_mmapped:
+            return
+        
+        if self.index_kind == "flat":
+            # The flat tier is saved unsharded; split it again
+            index = self._create_index("flat")
+            index.add(self.index.reconstruct_n(0, self.index.ntotal))
+        else:
+            index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        self.index, self._index_mmapped = index, False
+    
+    def _load_snapshot(self) -> bool:
+        """Restore the saved index (memory-mapped) and chunk metadata, if there is a usable one"""
+        try:
+            manifest = _read_manifest(self.snapshot_manifest_path)
+            if manifest is None:
+                return False
+            
+            with open(self.snapshot_manifest_path.parent / manifest["metadata"], 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot["model_name"] != self.model_name:
+                return False
             
-            # Normalize embeddings for cosine similarity
-            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            index = faiss.read_index(str(self.snapshot_manifest_path.parent / manifest["index"]), _MMAP_FLAG)
+            if index.ntotal != len(snapshot["documents"]):
+                logger.warning("RAG index snapshot is inconsistent, starting over")
+                return False
             
-            # Add to index
-            self.index.add(embeddings.astype('float32'))
+            self.index, self.index_kind, self._index_mmapped = index, snapshot["index_kind"], True
+            self.documents = snapshot["documents"]
+            self.sources = snapshot["sources"]
+            self._source_ids = {source: i for i, source in enumerate(self.sources)}
+            self.source_ids = snapshot["source_ids"]
+            self.content_type_names = snapshot["content_type_names"]
+            self._content_type_ids = {name: i for i, name in enumerate(self.content_type_names)}
+            self.content_types = snapshot["content_types"]
+            self.chunk_indices = snapshot["chunk_indices"]
+            self.project_fingerprints = snapshot["project_fingerprints"]
+            self._file_fingerprints = snapshot["file_fingerprints"]
+            self._file_chunk_ids = snapshot["file_chunk_ids"]
+            self._tombstones = snapshot["tombstones"]
+            
+            logger.info(f"Restored RAG index snapshot with {index.ntotal} vectors")
+            return True
             
-            # Store documents and metadata
-            for i, chunk in enumerate(chunks):
-                self.documents.append(chunk["content"])
-                self.document_metadata.append({
-                    "file_path": source,
-                    "content_type": chunk["type"],
-                    "chunk_index": i
-                })
+        except Exception as e:
+            logger.warning(f"Could not load RAG index snapshot: {e}")
+            return False
+    
+    async def _save_snapshot(self):
+        """Persist the index and chunk metadata so a restart can skip re-indexing"""
+        try:
+            async with self._save_lock:
+                index = self.index
+                if isinstance(index, faiss.IndexShards):
+                    # IndexShards cannot be serialized; save the flat tier as one index
+                    index = _flat_sq_index()
+                    index.add(self._reconstruct_all())
+                
+                # Serialize on the event loop so the snapshot is consistent; only the writes are offloaded
+                index_bytes = faiss.serialize_index(index)
+                metadata_bytes = pickle.dumps({
+                    "model_name": self.model_name,
+                    "index_kind": self.index_kind,
+                    "documents": self.documents,
+                    "sources": self.sources,
+                    "source_ids": self.source_ids,
+                    "content_type_names": self.content_type_names,
+                    "content_types": self.content_types,
+                    "chunk_indices": self.chunk_indices,
+                    "project_fingerprints": self.project_fingerprints,
+                    "file_fingerprints": self._file_fingerprints,
+                    "file_chunk_ids": self._file_chunk_ids,
+                    "tombstones": self._tombstones
+                }, protocol=pickle.HIGHEST_PROTOCOL)
+                
+                await asyncio.to_thread(_write_snapshot, self.snapshot_manifest_path, index_bytes, metadata_bytes)
                 
         except Exception as e:
-            logger.error(f"Error adding chunks to index: {e}")
+            logger.warning(f"Could not save RAG index snapshot: {e}")
     
     async def _load_framework_docs(self):
         """Load framework documentation if available"""
@@ -271,12 +896,19 @@ class RAGSystem:
             if not docs_dir.exists():
                 return
             
+            chunks = []
             for doc_file in docs_dir.glob("*.md"):
                 try:
                     content = doc_file.read_text(encoding='utf-8')
-                    await self.add_documentation(content, doc_file.name)
+                    chunks.extend(self._chunk_content(content, doc_file.name))
                 except Exception as e:
                     logger.warning(f"Could not load doc file {doc_file}: {e}")
+            
+            # One add and one snapshot for every doc rather than per file
+            if chunks:
+                await self._add_chunks_to_index(chunks)
+                await self._save_snapshot()
+                logger.info(f"Added {len(chunks)} framework documentation chunks")
                     
         except Exception as e:
             logger.warning(f"Could not load framework docs: {e}")
@@ -285,19 +917,33 @@ class RAGSystem:
         """Get RAG system statistics"""
         return {
             "initialized": self.initialized,
-            "total_documents": len(self.documents),
+            "total_documents": len(self.documents) - len(self._tombstones),
             "index_size": self.index.ntotal if self.index else 0,
+            "index_type": self.index_kind,
             "model_name": self.model_name
         }
     
     async def clear_index(self):
         """Clear the entire index"""
         try:
+            async with self._index_lock:
+                if self.index:
+                    self._reset_index()
+                self.documents.clear()
+                self.sources.clear()
+                self._source_ids.clear()
+                self.content_type_names.clear()
+                self._content_type_ids.clear()
+                self.source_ids = array('I')
+                self.content_types = array('B')
+                self.chunk_indices = array('I')
+                self.project_fingerprints = {}
+                self._file_fingerprints = {}
+                self._file_chunk_ids = {}
+                self._tombstones = set()
+                self.embeddings_cache.clear()
             if self.index:
-                self.index.reset()
-            self.documents.clear()
-            self.document_metadata.clear()
-            self.embeddings_cache.clear()
+                await self._save_snapshot()
             
             logger.info("RAG index cleared")
             
@@ -1,7 +1,10 @@
+import os
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
 from enum import Enum
 
 logger = logging.getLogger(__name__)
@@ -21,14 +24,103 @@ class StepStatus(str, Enum):
     RETRYING = "retrying"
 
 class StateManager:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncDatabase):
         self.db = db
+        
+        # Updates by document id are coalesced per collection for a short window
+        # and written in one bulk_write; readers flush first so they see them.
+        # The update methods only queue, so write errors surface in the flush log
+        self.flush_interval = int(os.getenv("STATE_FLUSH_INTERVAL_MS", "10")) / 1000
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._cached_now: Optional[datetime] = None
+    
+    def _now(self) -> datetime:
+        """Current UTC time, read once per event loop iteration and shared by every write in it"""
+        now = self._cached_now
+        if now is None:
+            now = self._cached_now = datetime.now(timezone.utc)
+            asyncio.get_running_loop().call_soon(self._clear_now)
+        return now
+    
+    def _clear_now(self):
+        """Drop the cached time at the end of the loop iteration"""
+        self._cached_now = None
+    
+    def _queue_update(self, collection: str, doc_id: str, set_fields: Dict[str, Any],
+                      inc_fields: Optional[Dict[str, float]] = None, push_log: Optional[Dict[str, Any]] = None):
+        """Merge an update into the pending one for the same document"""
+        update = self._pending.setdefault(collection, {}).setdefault(doc_id, {})
+        update.setdefault("$set", {}).update(set_fields)
+        if inc_fields:
+            inc = update.setdefault("$inc", {})
+            for field, amount in inc_fields.items():
+                inc[field] = inc.get(field, 0) + amount
+        if push_log is not None:
+            update.setdefault("$push", {"logs": {"$each": []}})["logs"]["$each"].append(push_log)
+        
+        # A flusher cancelled before it ever ran never reaches its cleanup, so a done task counts as none
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+    
+    async def _flush_soon(self):
+        """Flush pending updates once the coalescing window has passed"""
+        cancelled = False
+        try:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+        except asyncio.CancelledError:
+            # Whatever is still pending goes out with the next queued update or explicit flush
+            cancelled = True
+            raise
+        finally:
+            self._flush_task = None
+            if self._pending and not cancelled:
+                self._flush_task = asyncio.create_task(self._flush_soon())
+    
+    async def flush(self):
+        """Write all pending updates, one unordered bulk_write per collection"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            await asyncio.gather(*(
+                self._bulk_update(collection, updates) for collection, updates in pending.items()
+            ))
+    
+    async def _bulk_update(self, collection: str, updates: Dict[str, Dict[str, Any]]):
+        """Apply coalesced updates to a collection"""
+        try:
+            await self.db[collection].bulk_write(
+                [UpdateOne({"id": doc_id}, update) for doc_id, update in updates.items()],
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Error flushing {collection} updates: {e}")
+    
+    async def ensure_indexes(self):
+        """Create the indexes behind run/step lookups, step ordering and date-range queries"""
+        try:
+            await asyncio.gather(
+                self.db.runs.create_index("id", unique=True),
+                self.db.runs.create_index("created_at"),
+                self.db.runs.create_index([("status", 1), ("created_at", 1)]),
+                self.db.steps.create_index("id", unique=True),
+                self.db.steps.create_index([("run_id", 1), ("step_number", 1)]),
+                self.db.steps.create_index("created_at")
+            )
+        except Exception as e:
+            logger.error(f"Error creating indexes: {e}")
+    
+    async def _aggregate(self, collection, pipeline: List[Dict[str, Any]], length: Optional[int]) -> List[Dict[str, Any]]:
+        """Run an aggregation pipeline and collect its results"""
+        cursor = await collection.aggregate(pipeline)
+        return await cursor.to_list(length=length)
     
     async def create_run(self, run_data: Dict[str, Any]) -> str:
         """Create a new run record"""
         try:
-            run_data["created_at"] = datetime.now(timezone.utc)
-            run_data["updated_at"] = datetime.now(timezone.utc)
+            run_data["created_at"] = self._now()
+            run_data["updated_at"] = self._now()
             
             result = await self.db.runs.insert_one(run_data)
             return str(result.inserted_id)
@@ -40,86 +132,61 @@ class StateManager:
     async def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
         """Get run by ID"""
         try:
+            await self.flush()
             return await self.db.runs.find_one({"id": run_id})
         except Exception as e:
             logger.error(f"Error getting run {run_id}: {e}")
             return None
     
-    async def update_run_status(self, run_id: str, status: RunStatus) -> bool:
-        """Update run status"""
+    async def update_run_status(self, run_id: str, status: RunStatus):
+        """Queue a run status update"""
         try:
-            result = await self.db.runs.update_one(
-                {"id": run_id},
-                {
-                    "$set": {
-                        "status": status,
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
-            return result.modified_count > 0
-            
+            self._queue_update("runs", run_id, {
+                "status": status,
+                "updated_at": self._now()
+            })
         except Exception as e:
             logger.error(f"Error updating run status: {e}")
-            return False
     
-    async def update_current_step(self, run_id: str, step_number: int) -> bool:
-        """Update current step number"""
+    async def update_current_step(self, run_id: str, step_number: int):
+        """Queue a current step number update"""
         try:
-            result = await self.db.runs.update_one(
-                {"id": run_id},
-                {
-                    "$set": {
-                        "current_step": step_number,
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
-            return result.modified_count > 0
-            
+            self._queue_update("runs", run_id, {
+                "current_step": step_number,
+                "updated_at": self._now()
+            })
         except Exception as e:
             logger.error(f"Error updating current step: {e}")
-            return False
     
-    async def add_cost(self, run_id: str, cost_eur: float) -> bool:
-        """Add cost to run total"""
+    async def add_cost(self, run_id: str, cost_eur: float):
+        """Queue an increment of the run cost total"""
         try:
-            result = await self.db.runs.update_one(
-                {"id": run_id},
-                {
-                    "$inc": {"cost_used_eur": cost_eur},
-                    "$set": {"updated_at": datetime.now(timezone.utc)}
-                }
+            self._queue_update(
+                "runs", run_id,
+                {"updated_at": self._now()},
+                inc_fields={"cost_used_eur": cost_eur}
             )
-            return result.modified_count > 0
-            
         except Exception as e:
             logger.error(f"Error adding cost: {e}")
-            return False
     
-    async def add_log(self, run_id: str, log_entry: Dict[str, Any]) -> bool:
-        """Add log entry to run"""
+    async def add_log(self, run_id: str, log_entry: Dict[str, Any]):
+        """Queue a log entry for the run"""
         try:
-            log_entry["timestamp"] = datetime.now(timezone.utc)
+            log_entry["timestamp"] = self._now()
             
-            result = await self.db.runs.update_one(
-                {"id": run_id},
-                {
-                    "$push": {"logs": log_entry},
-                    "$set": {"updated_at": datetime.now(timezone.utc)}
-                }
+            self._queue_update(
+                "runs", run_id,
+                {"updated_at": self._now()},
+                push_log=log_entry
             )
-            return result.modified_count > 0
-            
         except Exception as e:
             logger.error(f"Error adding log: {e}")
-            return False
     
     async def create_step(self, step_data: Dict[str, Any]) -> str:
         """Create a new step record"""
         try:
-            step_data["created_at"] = datetime.now(timezone.utc)
-            step_data["updated_at"] = datetime.now(timezone.utc)
+            step_data["created_at"] = self._now()
+            step_data["updated_at"] = self._now()
             
             result = await self.db.steps.insert_one(step_data)
             return str(result.inserted_id)
@@ -128,42 +195,29 @@ class StateManager:
             logger.error(f"Error creating step: {e}")
             raise
     
-    async def update_step_status(self, step_id: str, status: StepStatus) -> bool:
-        """Update step status"""
+    async def update_step_status(self, step_id: str, status: StepStatus):
+        """Queue a step status update"""
         try:
-            result = await self.db.steps.update_one(
-                {"id": step_id},
-                {
-                    "$set": {
-                        "status": status,
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
-            return result.modified_count > 0
-            
+            self._queue_update("steps", step_id, {
+                "status": status,
+                "updated_at": self._now()
+            })
         except Exception as e:
             logger.error(f"Error updating step status: {e}")
-            return False
     
-    async def update_step_result(self, step_id: str, result_data: Dict[str, Any]) -> bool:
-        """Update step with execution results"""
+    async def update_step_result(self, step_id: str, result_data: Dict[str, Any]):
+        """Queue a step update with execution results"""
         try:
-            result_data["updated_at"] = datetime.now(timezone.utc)
-            
-            result = await self.db.steps.update_one(
-                {"id": step_id},
-                {"$set": result_data}
-            )
-            return result.modified_count > 0
+            result_data["updated_at"] = self._now()
             
+            self._queue_update("steps", step_id, result_data)
         except Exception as e:
             logger.error(f"Error updating step result: {e}")
-            return False
     
     async def get_step(self, step_id: str) -> Optional[Dict[str, Any]]:
         """Get step by ID"""
         try:
+            await self.flush()
             return await self.db.steps.find_one({"id": step_id})
         except Exception as e:
             logger.error(f"Error getting step {step_id}: {e}")
@@ -172,6 +226,7 @@ class StateManager:
     async def get_run_steps(self, run_id: str) -> List[Dict[str, Any]]:
         """Get all steps for a run"""
         try:
+            await self.flush()
             steps = await self.db.steps.find({"run_id": run_id}).sort("step_number", 1).to_list(length=None)
             return steps
         except Exception as e:
@@ -181,13 +236,15 @@ class StateManager:
     async def cancel_run(self, run_id: str) -> bool:
         """Cancel a running run"""
         try:
+            await self.flush()
+            
             # Update run status
             run_result = await self.db.runs.update_one(
                 {"id": run_id, "status": {"$in": ["pending", "running"]}},
                 {
                     "$set": {
                         "status": RunStatus.CANCELLED,
-                        "updated_at": datetime.now(timezone.utc)
+                        "updated_at": self._now()
                     }
                 }
             )
@@ -199,7 +256,7 @@ class StateManager:
                     "$set": {
                         "status": StepStatus.FAILED,
                         "error": "Run cancelled",
-                        "updated_at": datetime.now(timezone.utc)
+                        "updated_at": self._now()
                     }
                 }
             )
@@ -213,12 +270,13 @@ class StateManager:
     async def retry_step(self, run_id: str, step_number: int) -> bool:
         """Mark step for retry"""
         try:
+            await self.flush()
             result = await self.db.steps.update_one(
                 {"run_id": run_id, "step_number": step_number},
                 {
                     "$set": {
                         "status": StepStatus.RETRYING,
-                        "updated_at": datetime.now(timezone.utc)
+                        "updated_at": self._now()
                     },
                     "$inc": {"retries": 1}
                 }
@@ -232,8 +290,9 @@ class StateManager:
     async def get_daily_cost(self, date: Optional[datetime] = None) -> Dict[str, float]:
         """Get daily cost statistics"""
         try:
+            await self.flush()
             if not date:
-                date = datetime.now(timezone.utc)
+                date = self._now()
             
             start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
             end_of_day = date.replace(hour=23, minute=59, second=59, microsecond=999999)
@@ -258,7 +317,7 @@ class StateManager:
                 }
             ]
             
-            result = await self.db.runs.aggregate(pipeline).to_list(length=1)
+            result = await self._aggregate(self.db.runs, pipeline, 1)
             
             if result:
                 return {
@@ -276,25 +335,28 @@ class StateManager:
     async def get_run_statistics(self) -> Dict[str, Any]:
         """Get overall run statistics"""
         try:
-            # Get status counts
-            status_pipeline = [
-                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-            ]
-            status_stats = await self.db.runs.aggregate(status_pipeline).to_list(length=None)
-            
-            # Get cost statistics
-            cost_pipeline = [
+            await self.flush()
+            # Status counts and cost statistics from a single scan of runs
+            runs_pipeline = [
                 {
-                    "$group": {
-                        "_id": None,
-                        "total_cost": {"$sum": "$cost_used_eur"},
-                        "avg_cost": {"$avg": "$cost_used_eur"},
-                        "max_cost": {"$max": "$cost_used_eur"},
-                        "run_count": {"$sum": 1}
+                    "$facet": {
+                        "status": [
+                            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+                        ],
+                        "cost": [
+                            {
+                                "$group": {
+                                    "_id": None,
+                                    "total_cost": {"$sum": "$cost_used_eur"},
+                                    "avg_cost": {"$avg": "$cost_used_eur"},
+                                    "max_cost": {"$max": "$cost_used_eur"},
+                                    "run_count": {"$sum": 1}
+                                }
+                            }
+                        ]
                     }
                 }
             ]
-            cost_stats = await self.db.runs.aggregate(cost_pipeline).to_list(length=1)
             
             # Get step statistics
             step_pipeline = [
@@ -315,7 +377,14 @@ class StateManager:
                     }
                 }
             ]
-            step_stats = await self.db.steps.aggregate(step_pipeline).to_list(length=1)
+            
+            # The two collections are aggregated concurrently
+            runs_stats, step_stats = await asyncio.gather(
+                self._aggregate(self.db.runs, runs_pipeline, 1),
+                self._aggregate(self.db.steps, step_pipeline, 1)
+            )
+            status_stats = runs_stats[0]["status"] if runs_stats else []
+            cost_stats = runs_stats[0]["cost"] if runs_stats else []
             
             return {
                 "status_distribution": {stat["_id"]: stat["count"] for stat in status_stats},
@@ -330,7 +399,8 @@ class StateManager:
     async def cleanup_old_runs(self, days_old: int = 30) -> int:
         """Clean up old completed runs"""
         try:
-            cutoff_date = datetime.now(timezone.utc).replace(
+            await self.flush()
+            cutoff_date = self._now().replace(
                 hour=0, minute=0, second=0, microsecond=0
             ) - timezone.timedelta(days=days_old)
             
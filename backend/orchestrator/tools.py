@@ -1,16 +1,46 @@
 import os
+import re
 import logging
 import asyncio
 import subprocess
-import tempfile
 import shutil
+from collections import deque
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 import git
 from dataclasses import dataclass
+from .commands import CommandResult, drain_stream
 
 logger = logging.getLogger(__name__)
 
+# Lines of stdout/stderr kept per command; older output is dropped
+_OUTPUT_TAIL_LINES = 10_000
+
+# Classifies patch lines by their start: file headers, hunk headers ("@@ ... @@"),
+# and non-blank lines that are neither diff content nor a known header
+_PATCH_LINE_RE = re.compile(
+    r"^(?:"
+    r"(?P<old>--- )"
+    r"|(?P<new>\+\+\+ )"
+    r"|(?P<hunk>@@.*@@)"
+    r"|(?P<invalid>(?![ +\-]|diff --git|index |@@|new file|deleted file|similarity)(?=.*\S))"
+    r")",
+    re.MULTILINE
+)
+
+async def _feed_stream(stream: Optional[asyncio.StreamWriter], data: Optional[bytes]):
+    """Write data to a subprocess stdin and close it"""
+    if stream is None:
+        return
+    try:
+        stream.write(data)
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The process exited without reading all of its input
+        pass
+    finally:
+        stream.close()
+
 def is_valid_patch(patch_text: str) -> bool:
     """
     Validate patch format before applying
@@ -20,52 +50,47 @@ def is_valid_patch(patch_text: str) -> bool:
         logger.warning("Patch validation failed: empty patch")
         return False
     
-    lines = patch_text.strip().split(\'\
-\')
+    patch_text = patch_text.strip()
     
     # Check if patch starts with proper diff header
-    if not lines[0].startswith("diff --git"):
+    if not patch_text.startswith("diff --git"):
         logger.warning("Patch validation failed: missing \'diff --git\' header")
         return False
     
-    # Check for required file headers
+    # One scan finds the file headers, a hunk header and the first malformed line
     has_old_file = False
     has_new_file = False
+    has_hunk_header = False
+    invalid_at = None
     
-    for line in lines:
-        if line.startswith("--- "):
+    for match in _PATCH_LINE_RE.finditer(patch_text):
+        kind = match.lastgroup
+        if kind == "old":
             has_old_file = True
-        elif line.startswith("+++ "):
+        elif kind == "new":
             has_new_file = True
-            
+        elif kind == "hunk":
+            has_hunk_header = True
+        elif invalid_at is None:
+            invalid_at = match.start()
+        
+        if has_old_file and has_new_file and has_hunk_header and invalid_at is not None:
+            break
+    
     if not has_old_file or not has_new_file:
         logger.warning("Patch validation failed: missing \'---\' or \'+++\' file headers")
         return False
     
-    # Check for basic patch structure (should have at least one hunk)
-    has_hunk_header = False
-    for line in lines:
-        if line.startswith("@@") and "@@" in line[2:]:
-            has_hunk_header = True
-            break
-            
     if not has_hunk_header:
         logger.warning("Patch validation failed: missing hunk headers \'@@\'")
         return False
     
-    # Additional format checks
-    for i, line in enumerate(lines, 1):
-        # Skip headers and hunk headers
-        if (line.startswith(("diff --git", "index ", "--- ", "+++ ", "@@")) or 
-            line.startswith(("new file", "deleted file", "similarity"))):
-            continue
-            
-        # Check that patch lines start with valid prefixes
-        if line and not line.startswith((" ", "+", "-")):
-            # Allow empty lines in patches
-            if line.strip():
-                logger.warning(f"Patch validation failed: invalid line format at line {i}: \'{line[:50]}...\'")
-                return False
+    if invalid_at is not None:
+        line_end = patch_text.find('\n', invalid_at)
+        line = patch_text[invalid_at:line_end if line_end != -1 else len(patch_text)]
+        i = patch_text.count('\n', 0, invalid_at) + 1
+        logger.warning(f"Patch validation failed: invalid line format at line {i}: \'{line[:50]}...\'")
+        return False
     
     return True
 @dataclass
@@ -119,32 +144,20 @@ class ToolManager:
                 logger.error("Patch validation failed: Invalid patch format. Please provide a valid unified diff patch.")
                 return False
             
-            # Create temporary patch file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.patch', delete=False) as f:
-                f.write(patch)
-                patch_file = f.name
+            # git apply is all-or-nothing (nothing is written if any hunk fails), so no
+            # separate --check run is needed; the patch is fed on stdin, not via a temp file
+            result = await self._run_command(
+                ["git", "apply"],
+                cwd=project_path,
+                stdin_data=patch.encode('utf-8')
+            )
             
-            try:
-                # Apply patch using git apply
-                result = await self._run_command(
-                    ["git", "apply", "--check", patch_file],
-                    cwd=project_path
-                )
-                
-                if result.returncode == 0:
-                    # Patch is valid, apply it
-                    result = await self._run_command(
-                        ["git", "apply", patch_file],
-                        cwd=project_path
-                    )
-                    return result.returncode == 0
-                else:
-                    logger.warning(f"Git patch validation failed: {result.stderr}")
-                    logger.error("Unable to apply patch. Please provide a valid patch that can be applied.")
-                    return False
-                    
-            finally:
-                os.unlink(patch_file)
+            if result.returncode != 0:
+                logger.warning(f"Git patch validation failed: {result.stderr}")
+                logger.error("Unable to apply patch. Please provide a valid patch that can be applied.")
+                return False
+            
+            return True
                 
         except Exception as e:
             logger.error(f"Error applying patch: {e}")
@@ -233,26 +246,32 @@ class ToolManager:
         
         return commands_map.get(test_type, [])
     
-    async def _run_command(self, command: List[str], cwd: Optional[str] = None):
-        """Run command with timeout"""
+    async def _run_command(self, command: List[str], cwd: Optional[str] = None,
+                           stdin_data: Optional[bytes] = None) -> CommandResult:
+        """Run command with timeout, optionally feeding stdin_data to its stdin"""
         try:
             process = await asyncio.create_subprocess_exec(
                 *command,
                 cwd=cwd,
+                stdin=asyncio.subprocess.PIPE if stdin_data is not None else None,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
             
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
+            # Stream both pipes into bounded tails rather than buffering everything
+            stdout = deque(maxlen=_OUTPUT_TAIL_LINES)
+            stderr = deque(maxlen=_OUTPUT_TAIL_LINES)
+            await asyncio.wait_for(
+                asyncio.gather(
+                    _feed_stream(process.stdin, stdin_data),
+                    drain_stream(process.stdout, stdout),
+                    drain_stream(process.stderr, stderr),
+                    process.wait()
+                ),
                 timeout=self.timeout
             )
             
-            return type('CommandResult', (), {
-                'returncode': process.returncode,
-                'stdout': stdout.decode('utf-8', errors='ignore'),
-                'stderr': stderr.decode('utf-8', errors='ignore')
-            })()
+            return CommandResult(process.returncode, b"".join(stdout), b"".join(stderr))
             
         except asyncio.TimeoutError:
             logger.error(f"Command timeout: {' '.join(command)}")
@@ -2,7 +2,7 @@ from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient
 import os
 import logging
 import json
@@ -33,7 +33,7 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncMongoClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Initialize orchestrator components
@@ -157,7 +157,7 @@ async def create_run(run_data: RunCreate, background_tasks: BackgroundTasks):
 async def get_run(run_id: str):
     """Get run details"""
     try:
-        run_data = await db.runs.find_one({"id": run_id})
+        run_data = await state_manager.get_run(run_id)
         if not run_data:
             raise HTTPException(status_code=404, detail="Run not found")
         return Run(**run_data)
@@ -171,6 +171,8 @@ async def get_run(run_id: str):
 async def list_runs(limit: int = 10, offset: int = 0):
     """List all runs"""
     try:
+        # Pending run updates are coalesced in the state manager; write them before reading
+        await state_manager.flush()
         runs = await db.runs.find().skip(offset).limit(limit).sort("created_at", -1).to_list(length=None)
         return [Run(**run) for run in runs]
     except Exception as e:
@@ -263,7 +265,7 @@ async def stream_run_logs(run_id: str):
         last_log_count = 0
         while True:
             try:
-                run_data = await db.runs.find_one({"id": run_id})
+                run_data = await state_manager.get_run(run_id)
                 if not run_data:
                     break
                 
@@ -537,7 +539,7 @@ async def get_admin_stats():
 async def clear_prompt_cache():
     """Clear prompt cache"""
     try:
-        cleared_count = await llm_router.prompt_cache.clear_cache()
+        cleared_count = llm_router.prompt_cache.clear_cache()
         return {"message": f"Cleared {cleared_count} cached prompts"}
     except Exception as e:
         logging.error(f"Error clearing cache: {e}")
@@ -549,7 +551,7 @@ async def execute_run(run_id: str, from_step: int = 0):
     """Execute a run with AI orchestration"""
     try:
         # Get run details
-        run_data = await db.runs.find_one({"id": run_id})
+        run_data = await state_manager.get_run(run_id)
         if not run_data:
             return
         
@@ -557,7 +559,10 @@ async def execute_run(run_id: str, from_step: int = 0):
         
         # Update status to running
         await state_manager.update_run_status(run_id, RunStatus.RUNNING)
-        
+
+        # Tests need the workspace dependencies installed in the background
+        await project_manager.wait_for_install(run_id)
+
         # Initialize RAG system with project context
         if run.project_path:
             await rag_system.index_project(run.project_path)
@@ -572,7 +577,7 @@ async def execute_run(run_id: str, from_step: int = 0):
         while current_step < run.max_steps:
             try:
                 # Check if run was cancelled
-                run_data = await db.runs.find_one({"id": run_id})
+                run_data = await state_manager.get_run(run_id)
                 if not run_data or Run(**run_data).status == RunStatus.CANCELLED:
                     break
                 
@@ -592,7 +597,7 @@ async def execute_run(run_id: str, from_step: int = 0):
                 current_step += 1
                 
                 # Check budget limit
-                run_data = await db.runs.find_one({"id": run_id})
+                run_data = await state_manager.get_run(run_id)
                 if run_data and Run(**run_data).cost_used_eur >= run.daily_budget_eur:
                     await state_manager.add_log(run_id, {"type": "warning", "content": "Daily budget limit reached"})
                     break
@@ -649,7 +654,7 @@ async def execute_step(run_id: str, step_number: int) -> Step:
     """Execute a single step"""
     try:
         # Get run details
-        run_data = await db.runs.find_one({"id": run_id})
+        run_data = await state_manager.get_run(run_id)
         run = Run(**run_data)
         
         # Create step record
@@ -833,6 +838,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_db_indexes():
+    await state_manager.ensure_indexes()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await state_manager.flush()
+    await client.close()
\ No newline at end of file
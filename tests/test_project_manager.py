@@ -0,0 +1,94 @@
+import asyncio
+import os
+import stat
+import sys
+
+import pytest
+
+pytest.importorskip("orjson")
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="installs use flock and shell scripts")
+
+from orchestrator.project_manager import ProjectManager
+
+
+async def _wait_until(predicate, timeout: float = 5.0):
+    """Poll predicate until it holds, failing the test after timeout seconds"""
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+@pytest.fixture
+def project_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROJECTS_BASE_PATH", str(tmp_path / "projects"))
+    monkeypatch.setenv("PACKAGE_CACHE_PATH", str(tmp_path / "cache"))
+    return tmp_path
+
+
+def test_delete_project_during_install_removes_workspace(project_env, monkeypatch):
+    # A composer that keeps writing into its working directory until it is killed
+    bin_dir = project_env / "bin"
+    bin_dir.mkdir()
+    composer = bin_dir / "composer"
+    composer.write_text(
+        "#!/bin/sh\n"
+        "i=0\n"
+        "while true; do mkdir -p vendor/p$i && echo x > vendor/p$i/f; i=$((i+1)); done\n"
+    )
+    composer.chmod(composer.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    
+    async def scenario():
+        manager = ProjectManager()
+        await manager.create_project_workspace("p1", "laravel", "Demo")
+        vendor = manager.get_code_path("p1") / "vendor"
+        await _wait_until(vendor.exists)
+        
+        assert await manager.delete_project("p1")
+        assert not manager.get_project_path("p1").exists()
+        
+        # The installer is gone too, so nothing recreates the workspace afterwards
+        await asyncio.sleep(0.2)
+        assert not manager.get_project_path("p1").exists()
+        assert await manager.wait_for_install("p1") is None
+    
+    asyncio.run(scenario())
+
+
+def test_installs_queued_for_one_tool_do_not_block_other_tools(project_env, monkeypatch):
+    monkeypatch.setenv("MAX_CONCURRENT_INSTALLS", "2")
+    
+    async def scenario():
+        manager = ProjectManager()
+        started = []
+        release = {}
+        
+        async def install(tool: str, n: int):
+            name = f"{tool}-{n}"
+            release[name] = asyncio.Event()
+            async with manager._install_slot(tool):
+                started.append(name)
+                await release[name].wait()
+        
+        tasks = [asyncio.create_task(install("composer", n)) for n in range(3)]
+        await asyncio.sleep(0.05)
+        tasks.append(asyncio.create_task(install("yarn", 0)))
+        tasks.append(asyncio.create_task(install("pip", 0)))
+        
+        # composer-1 and composer-2 wait on the composer lock, not on a global slot
+        await _wait_until(lambda: len(started) == 2)
+        assert started == ["composer-0", "yarn-0"]
+        
+        # The freed slot goes to pip, which was waiting for one, before the next composer
+        release["composer-0"].set()
+        await _wait_until(lambda: len(started) == 3)
+        assert started[2] == "pip-0"
+        
+        for name in ("yarn-0", "pip-0", "composer-1", "composer-2"):
+            await _wait_until(lambda: name in started)
+            release[name].set()
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+        assert sorted(started) == ["composer-0", "composer-1", "composer-2", "pip-0", "yarn-0"]
+    
+    asyncio.run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from orchestrator import rag_system
+from orchestrator.rag_system import RAGSystem
+
+
+class HashingModel:
+    """Stand-in for the embedding model: a fixed random unit vector per text"""
+    
+    def encode(self, texts, **kwargs):
+        vectors = np.stack([
+            np.random.default_rng(int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little'))
+            .standard_normal(rag_system.EMBEDDING_DIM)
+            for text in texts
+        ]).astype('float32')
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _make_rag(tmp_path, monkeypatch, index_type: str) -> RAGSystem:
+    monkeypatch.setenv("RAG_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("RAG_INDEX_TYPE", index_type)
+    rag = RAGSystem()
+    rag.model = HashingModel()
+    rag._reset_index()
+    rag._open_embedding_cache()
+    rag.initialized = True
+    return rag
+
+
+def _write_sources(project, names, version: str):
+    for name in names:
+        (project / f"{name}.py").write_text(f"def {name}_{version}():\n    return '{name} {version}'\n")
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_compaction_keeps_search_results_correct(tmp_path, monkeypatch, index_type):
+    project = tmp_path / "project"
+    project.mkdir()
+    names = [f"module{i}" for i in range(6)]
+    _write_sources(project, names, "v1")
+    
+    async def scenario():
+        rag = _make_rag(tmp_path, monkeypatch, index_type)
+        assert await rag.index_project(str(project)) == 6
+        old_texts = {name: (project / f"{name}.py").read_text().strip() for name in names}
+        
+        # Rewriting most files retires more than half the chunks, which triggers compaction
+        changed = names[:4]
+        _write_sources(project, changed, "v2")
+        assert await rag.index_project(str(project)) == 6
+        assert not rag._tombstones
+        assert rag.index.ntotal == len(rag.documents) == 6
+        
+        for name in names:
+            text = (project / f"{name}.py").read_text().strip()
+            context = await rag.get_relevant_context(text, max_chunks=1)
+            assert context == f"From {project / f'{name}.py'}:\n{text}\n"
+        
+        # Retired chunks are gone from both the index and the chunk columns
+        for name in changed:
+            assert old_texts[name] not in await rag.get_relevant_context(old_texts[name], max_chunks=6)
+    
+    asyncio.run(scenario())